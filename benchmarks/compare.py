@@ -0,0 +1,53 @@
+"""
+Compare two benchmark results.
+
+    python -m benchmarks.compare old.json new.json [--threshold 1.1]
+
+Exits with status 1 if any benchmark got slower by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path, 'r') as f:
+        report = json.load(f)
+    return {
+        (result['name'], json.dumps(result['params'], sort_keys=True)): result
+        for result in report['results']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=1.1,
+                        help='slowdown ratio reported as a regression (default: 1.1)')
+    args = parser.parse_args()
+
+    old = load(args.old)
+    new = load(args.new)
+
+    regressions = 0
+    for key, result in new.items():
+        if key not in old:
+            continue
+
+        ratio = result['median'] / old[key]['median']
+        mark = ''
+        if ratio > args.threshold:
+            mark = ' REGRESSION'
+            regressions += 1
+
+        name, params = key
+        print(f'{name} {params}: '
+              f'{old[key]["median"] * 1000:.3f} ms -> {result["median"] * 1000:.3f} ms '
+              f'({ratio:.2f}x){mark}')
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
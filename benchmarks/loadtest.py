@@ -0,0 +1,258 @@
+"""
+Load test of the buttercup browser API with simulated browser clients.
+
+    python -m benchmarks.loadtest [--clients 10] [--concurrency 8]
+                                  [--duration 10] [--items 1000]
+                                  [--mix url=5,specific=2,otps=1,tree=2]
+                                  [--output results.json]
+
+Starts `kitsupass buttercup` in process on a synthetic storage, registers
+the clients through /v1/auth/response and replays a weighted mix of
+requests from concurrent connections, then reports the throughput and
+latency percentiles of every kind of request.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import threading
+import time
+
+from jwskate import Jwk
+
+from kitsupass import index, storage
+
+from .vault import PASSWORD, generate, generate_items
+
+# keep benchmark passwords out of the user keyring
+storage.load_password = lambda id: None
+storage.save_password = lambda id, password: None
+storage.remove_password = lambda id: None
+
+MIX = 'url=5,specific=2,otps=1,tree=2'
+
+
+class Client:
+    """
+    Simulated browser client.
+    """
+
+    def __init__(self, port: int):
+        from kitsupass.buttercup.symbols import API_KEY_ALGO, API_KEY_CURVE
+
+        self.port = port
+        self.id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=26))
+        self.private_key = Jwk.generate(kty=API_KEY_ALGO[:2], crv=API_KEY_CURVE)
+        self.session = None
+        self.etag = None
+
+    def register(self, app) -> None:
+        from kitsupass.buttercup.auth import Session
+
+        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
+        app.set_code(code)
+
+        connection = http.client.HTTPConnection('localhost', self.port)
+        connection.request('POST', '/v1/auth/response', json.dumps({
+            'code': code,
+            'id': self.id,
+            'publicKey': self.private_key.public_jwk().to_json(),
+        }), headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f'registration failed: {response.status}')
+        public_key = Jwk(json.loads(json.loads(response.read())['publicKey']))
+        connection.close()
+
+        # the shared secret is symmetric, so the server session works both ways
+        self.session = Session(public_key.to_dict(), self.private_key.to_dict())
+
+    def request(self, connection, method: str, path: str, body: dict | None = None,
+                verify: bool = False) -> int:
+        from kitsupass.buttercup.auth import decryptSessionPayload, encryptSessionPayload
+
+        headers = {'Authorization': f'Bearer {self.id}'}
+        data = None
+        if body is not None:
+            headers['X-Content-Type'] = 'application/json'
+            data = encryptSessionPayload(self.session, json.dumps(body).encode())
+        if path.startswith('/v1/vaults-tree') and self.etag:
+            headers['If-None-Match'] = self.etag
+
+        connection.request(method, path, data, headers=headers)
+        response = connection.getresponse()
+        content = response.read()
+
+        if response.status == 200 and path.startswith('/v1/vaults-tree'):
+            self.etag = response.getheader('ETag')
+        if response.status == 200 and verify:
+            json.loads(decryptSessionPayload(self.session, content.decode()))
+        return response.status
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(','):
+        kind, _, weight = item.partition('=')
+        weights[kind] = int(weight or 1)
+    return weights
+
+
+def make_request(kind: str, rng: random.Random, names: list, hosts: list, vault_id: str):
+    if kind == 'url':
+        return 'GET', f'/v1/entries?type=url&url=https://{rng.choice(hosts)}/login', None
+    if kind == 'specific':
+        return 'POST', '/v1/entries/specific', {'entries': [
+            {'entryID': name, 'sourceID': vault_id}
+            for name in rng.sample(names, rng.randint(1, 5))
+        ]}
+    if kind == 'otps':
+        return 'GET', '/v1/otps', None
+    if kind == 'tree':
+        return 'GET', '/v1/vaults-tree', None
+    raise ValueError(kind)
+
+
+def percentile(quantiles: list, p: int) -> float:
+    return quantiles[p - 1] if quantiles else 0
+
+
+def summarize(kind: str, latencies: list, errors: int, elapsed: float) -> dict:
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) >= 2 else latencies * 99
+    return {
+        'kind': kind,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed,
+        'p50': percentile(quantiles, 50),
+        'p95': percentile(quantiles, 95),
+        'p99': percentile(quantiles, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.loadtest')
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--mix', default=MIX)
+    parser.add_argument('--port', type=int, default=12823)
+    parser.add_argument('--verify', action='store_true',
+                        help='decrypt every response on the client side')
+    parser.add_argument('--output', help='JSON file (default: stdout)')
+    args = parser.parse_args()
+    weights = parse_mix(args.mix)
+
+    from kitsupass.buttercup import config
+    from kitsupass.buttercup.api import app
+
+    tmp = tempfile.TemporaryDirectory()
+    config.CONFIG_PATH = os.path.join(tmp.name, 'config.json')
+    config.CONFIG.clear()
+    index.CACHE_PATH = os.path.join(tmp.name, 'cache')
+
+    vault_path = os.path.join(tmp.name, 'vault')
+    vault_id = str(generate(vault_path, args.items))
+    items = list(generate_items(args.items))
+    names = [name for name, data in items]
+    hosts = [data.split('URL: https://')[1].partition('/')[0] for name, data in items]
+
+    s = storage.Storage()
+    s.path = vault_path
+    s.open(PASSWORD)
+    app.create(storage=s)
+
+    server = threading.Thread(target=app.run, kwargs={'port': args.port, 'quiet': True}, daemon=True)
+    server.start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            http.client.HTTPConnection('localhost', args.port).connect()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+    clients = [Client(args.port) for i in range(args.clients)]
+    for client in clients:
+        client.register(app)
+
+    latencies = {kind: [] for kind in weights}
+    errors = {kind: 0 for kind in weights}
+    lock = threading.Lock()
+    stop = time.monotonic() + args.duration
+
+    def worker(i: int):
+        rng = random.Random(i)
+        connection = http.client.HTTPConnection('localhost', args.port)
+        kinds = list(weights)
+        while time.monotonic() < stop:
+            kind = rng.choices(kinds, weights=[weights[k] for k in kinds])[0]
+            client = rng.choice(clients)
+            method, path, body = make_request(kind, rng, names, hosts, vault_id)
+
+            start = time.perf_counter()
+            try:
+                status = client.request(connection, method, path, body, verify=args.verify)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('localhost', args.port)
+                status = None
+            latency = time.perf_counter() - start
+
+            with lock:
+                if status in (200, 304):
+                    latencies[kind].append(latency)
+                else:
+                    errors[kind] += 1
+        connection.close()
+
+    start = time.monotonic()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    results = [summarize(kind, latencies[kind], errors[kind], elapsed) for kind in weights]
+    results.append(summarize(
+        'total',
+        [latency for kind in weights for latency in latencies[kind]],
+        sum(errors.values()),
+        elapsed,
+    ))
+    for result in results:
+        print(f'{result["kind"]}: {result["requests"]} requests, {result["errors"]} errors, '
+              f'{result["throughput"]:.1f} req/s, '
+              f'p50 {result["p50"] * 1000:.1f} ms, p95 {result["p95"] * 1000:.1f} ms, '
+              f'p99 {result["p99"] * 1000:.1f} ms', file=sys.stderr)
+
+    report = {
+        'clients': args.clients,
+        'concurrency': args.concurrency,
+        'duration': elapsed,
+        'items': args.items,
+        'mix': weights,
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Crypto and storage micro-benchmarks.
+
+    python -m benchmarks.run [--sizes 100,10000,100000] [--formats 1,2]
+                             [--groups openssl,storage,buttercup]
+                             [--workers 1,2,8]
+                             [--output results.json]
+
+Results are written as JSON and can be compared between commits with
+`python -m benchmarks.compare old.json new.json`.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from kitsupass import index, openssl, storage
+from kitsupass.cache import Cache
+
+from .vault import PASSWORD, generate
+
+BENCHMARKS = {}
+
+# keep benchmark passwords out of the user keyring
+storage.load_password = lambda id: None
+storage.save_password = lambda id, password: None
+storage.remove_password = lambda id: None
+
+
+def benchmark(group: str):
+    def decorator(f):
+        BENCHMARKS[group] = f
+        return f
+    return decorator
+
+
+def measure(results: list, name: str, params: dict, f, repeat: int = 5, number: int = 1,
+            setup=None) -> None:
+    times = []
+    for i in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for j in range(number):
+            f()
+        times.append((time.perf_counter() - start) / number)
+
+    result = {
+        'name': name,
+        'params': params,
+        'repeat': repeat,
+        'number': number,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+    }
+    results.append(result)
+    print(f'{name} {params}: {result["median"] * 1000:.3f} ms', file=sys.stderr)
+
+
+@benchmark('openssl')
+def bench_openssl(results: list, args) -> None:
+    key = openssl.derive_key(PASSWORD, b'salt')
+    measure(results, 'openssl.derive_key', {}, lambda: openssl.derive_key(PASSWORD, b'salt'))
+
+    for size in (64, 1024, 64 * 1024):
+        text = 'x' * size
+        params = {'size': size}
+
+        data = openssl.encrypt(text, PASSWORD)
+        measure(results, 'openssl.encrypt', params, lambda: openssl.encrypt(text, PASSWORD))
+        measure(results, 'openssl.decrypt', params, lambda: openssl.decrypt(data, PASSWORD))
+
+        data_v2 = openssl.encrypt_v2(text, key)
+        measure(results, 'openssl.encrypt_v2', params,
+                lambda: openssl.encrypt_v2(text, key), number=100)
+        measure(results, 'openssl.decrypt_v2', params,
+                lambda: openssl.decrypt_v2(data_v2, key), number=100)
+
+
+@benchmark('storage')
+def bench_storage(results: list, args) -> None:
+    for size in args.sizes:
+        for version in args.formats:
+            with tempfile.TemporaryDirectory() as path:
+                bench_storage_size(results, args, path, size, version)
+
+
+def bench_storage_size(results: list, args, path: str, size: int, version: int) -> None:
+    params = {'items': size, 'format': version}
+    vault_path = os.path.join(path, 'vault')
+    index.CACHE_PATH = os.path.join(path, 'cache')
+
+    start = time.perf_counter()
+    generate(vault_path, size, version=version)
+    print(f'generated {params} in {time.perf_counter() - start:.1f} s', file=sys.stderr)
+
+    def open_storage() -> storage.Storage:
+        s = storage.Storage()
+        s.path = vault_path
+        s.open(PASSWORD)
+        return s
+
+    s = open_storage()
+    s.cache = Cache(size=0)
+    measure(results, 'storage.open', params, open_storage)
+
+    def remove_index():
+        s._index = None
+        index_path = os.path.join(index.CACHE_PATH, f'{s.id}.index')
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+    measure(results, 'storage.index.build', params, lambda: list(s.find()),
+            repeat=1, setup=remove_index)
+
+    def load_index() -> index.Index:
+        s._index = None
+        return s.index
+
+    measure(results, 'storage.index.load', params, load_index, repeat=3)
+    measure(results, 'storage.find', params, lambda: list(s.find('mail')))
+    for pattern in ('ml', 'gmail'):
+        measure(results, 'storage.fuzzy', params | {'pattern': pattern},
+                lambda: s.fuzzy(pattern, limit=10))
+
+    rng = random.Random(0)
+    names = sorted(s.index.entries)
+    sample = rng.sample(names, min(len(names), 100))
+    measure(results, 'storage.show', params, lambda: s.show(rng.choice(sample)), number=10)
+    # decryption workers, as set by KITSUPASS_WORKERS
+    for workers in args.workers:
+        measure(results, 'storage.show_many', params | {'count': len(sample), 'workers': workers},
+                lambda: s.show_many(sample, workers), repeat=3)
+
+    counter = iter(range(10 ** 9))
+    os.makedirs(os.path.join(vault_path, 'bench'))
+    measure(results, 'storage.insert', params,
+            lambda: s.insert(f'bench/item{next(counter)}', 'password\nusername: user\n'),
+            number=10)
+
+
+@benchmark('buttercup')
+def bench_buttercup(results: list, args) -> None:
+    try:
+        from jwskate import Jwk
+        from kitsupass.buttercup import auth, config
+    except ImportError as e:
+        print(f'skipping buttercup: {e}', file=sys.stderr)
+        return
+
+    with tempfile.TemporaryDirectory() as path:
+        config.CONFIG_PATH = os.path.join(path, 'config.json')
+        config.CONFIG.clear()
+        auth.generateBrowserKeys()
+
+        clientID = 'BENCHMARK0000000000000000'
+        clientKey = Jwk.generate(kty=auth.API_KEY_ALGO[:2], crv=auth.API_KEY_CURVE)
+        config.setConfigValue('browserClients', {
+            clientID: clientKey.public_jwk().to_dict(),
+        })
+
+        for size in (1024, 64 * 1024):
+            payload = os.urandom(size // 2).hex().encode()
+            params = {'size': size}
+
+            def roundtrip():
+                auth.decryptAPIPayload(clientID, auth.encryptAPIPayload(clientID, payload))
+
+            measure(results, 'buttercup.roundtrip.cold', params, roundtrip,
+                    repeat=3, setup=lambda: auth.resetSession(clientID))
+            measure(results, 'buttercup.roundtrip', params, roundtrip, number=10)
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run')
+    parser.add_argument('--sizes', default='100,10000',
+                        help='comma separated storage sizes (default: 100,10000)')
+    parser.add_argument('--formats', default='2',
+                        help='comma separated storage formats (default: 2)')
+    parser.add_argument('--groups', default=','.join(BENCHMARKS))
+    parser.add_argument('--workers', default=f'1,2,{os.cpu_count() or 1}',
+                        help='comma separated numbers of decryption workers of show_many '
+                             '(default: 1,2,cpu count)')
+    parser.add_argument('--output', help='JSON file (default: stdout)')
+    args = parser.parse_args()
+    args.sizes = [int(i) for i in args.sizes.split(',')]
+    args.formats = [int(i) for i in args.formats.split(',')]
+    args.workers = sorted({int(i) for i in args.workers.split(',')})
+
+    results = []
+    for group in args.groups.split(','):
+        BENCHMARKS[group](results, args)
+
+    report = {
+        'commit': get_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Deterministic generator of synthetic password storages.
+
+    python -m benchmarks.vault path [count] [--format 1|2] [--seed 0]
+"""
+import argparse
+import os
+import random
+import string
+import uuid
+
+from kitsupass.openssl import derive_key, encrypt, encrypt_v2
+
+PASSWORD = 'password'
+FOLDERS = ('', '', '', 'work', 'personal', 'ssh', 'work/servers')
+TLDS = ('com', 'net', 'org', 'io', 'co.uk', 'de', 'dev')
+
+
+def generate_items(count: int, seed: int = 0):
+    """
+    Yield (name, data) pairs, the same for the same count and seed.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        domain = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12)))
+        host = f'{domain}.{rng.choice(TLDS)}'
+        if rng.random() < 0.2:
+            host = f'{rng.choice(("mail", "login", "accounts", "www"))}.{host}'
+
+        folder = rng.choice(FOLDERS)
+        name = os.path.join(folder, f'{host} {i}' if rng.random() < 0.1 else host)
+        password = ''.join(rng.choices(string.ascii_letters + string.digits, k=20))
+
+        data = f'{password}\n'
+        data += f'username: {rng.choice(("admin", "user", domain))}{i}\n'
+        data += f'URL: https://{host}/{rng.choice(("", "login", "signin"))}\n'
+        if rng.random() < 0.1:
+            secret = ''.join(rng.choices(string.ascii_uppercase + '234567', k=32))
+            data += f'TOTP: otpauth://totp/{host}?secret={secret}\n'
+        yield name, data
+
+
+def generate(path: str, count: int, version: int = 2, seed: int = 0,
+             password: str = PASSWORD) -> uuid.UUID:
+    """
+    Create a storage of count items at path and return its id.
+    """
+    vault_id = uuid.UUID(int=random.Random(seed).getrandbits(128), version=4)
+    os.makedirs(path)
+
+    if version == 2:
+        key = derive_key(password, vault_id.bytes)
+        encrypt_item = lambda text: encrypt_v2(text, key)
+    else:
+        encrypt_item = lambda text: encrypt(text, password)
+
+    with open(os.path.join(path, f'.{vault_id.urn}'), 'w') as f:
+        f.write(encrypt_item(str(vault_id)))
+
+    taken = set()
+    for name, data in generate_items(count, seed):
+        while name in taken:
+            name += '_'
+        taken.add(name)
+
+        os.makedirs(os.path.join(path, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(encrypt_item(data))
+
+    return vault_id
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.vault')
+    parser.add_argument('path')
+    parser.add_argument('count', type=int, nargs='?', default=100)
+    parser.add_argument('--format', type=int, choices=(1, 2), default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    vault_id = generate(args.path, args.count, version=args.format, seed=args.seed)
+    print(f'{args.path}: {args.count} items, id {vault_id}, password {PASSWORD!r}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,52 +1,141 @@
-import copy
+import argparse
 import csv
 import os
+import re
 import sys
 
 from urllib.parse import urlparse
 
-from kitsupass.storage import Storage
+from kitsupass.agent import get_storage
+from kitsupass.entry import META_FIELDS, Entry
+
+BATCH_SIZE = 100
+
+
+def parse_row(row: dict) -> tuple[str, str] | None:
+    attributes = {}
+    password = ''
+    for k, v in row.items():
+        if k.startswith('!') or k == 'id' or not v:
+            continue
+
+        if k == 'password':
+            password = v
+            continue
+
+        if k.lower() == 'url':
+            attributes['URL'] = v
+            continue
+
+        attributes[k] = v
+
+    url = urlparse(attributes.get('URL'))
+    name = url.netloc
+    if not name:
+        return
+
+    # the indexed fields first
+    fields = {k: attributes.pop(k) for k in META_FIELDS if k in attributes} | attributes
+    return name, str(Entry.create(password, fields))
+
+
+def read_batches(f, skip: int = 0, size: int = BATCH_SIZE):
+    """
+    Read rows lazily and yield (number of rows read, items) batches.
+    """
+    batch = []
+    count = 0
+    for count, row in enumerate(csv.DictReader(f), 1):
+        if count <= skip:
+            continue
+
+        if item := parse_row(row):
+            batch.append(item)
+
+        if len(batch) >= size:
+            yield count, batch
+            batch = []
+
+    if batch or count > skip:
+        yield count, batch
+
+
+def drop_imported(storage, batch):
+    """
+    Drop items which an interrupted import already inserted, i.e. items with
+    the data of an existing item of their name or of its `name (n)` copies.
+    """
+    existing = {}
+    remaining = []
+    for name, data in batch:
+        if name not in existing:
+            copy_re = re.compile(rf'{re.escape(name)}( \(\d+\))?')
+            names = [n for n in storage.find(name) if copy_re.fullmatch(n)]
+            existing[name] = storage.show_many(names)
+        if data in existing[name]:
+            existing[name].remove(data)
+        else:
+            remaining.append((name, data))
+    return remaining
+
+
+def read_progress(path: str) -> int:
+    try:
+        with open(path, 'r') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def write_progress(path: str, count: int) -> None:
+    with open(path, 'w') as f:
+        f.write(str(count))
 
 
 def main():
-    storage = Storage(has_terminal=True)
-    storage.open()
-
-    with open(sys.argv[1], 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            attributes = {}
-            password = ''
-            for k, v in row.items():
-                if k.startswith('!') or k == 'id' or not v:
-                    continue
-
-                if k == 'password':
-                    password = v
-                    continue
-
-                if k.lower() == 'url':
-                    attributes['URL'] = v
-                    continue
-
-                attributes[k] = v
-
-            url = urlparse(attributes.get('URL'))
-            name = url.netloc
-            if not name:
+    parser = argparse.ArgumentParser(
+        prog='python -m importer.csv',
+        description='Import passwords from a CSV file exported by a browser.')
+    parser.add_argument('path')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='list the items without importing them')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore the progress of an interrupted import')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    progress_path = f'{args.path}.progress'
+    skip = 0 if args.restart or args.dry_run else read_progress(progress_path)
+    # the progress file exists while an import runs, so a batch may have
+    # been inserted in part when the import is resumed
+    resumed = not args.restart and not args.dry_run and os.path.exists(progress_path)
+
+    storage = None
+    if not args.dry_run:
+        storage = get_storage(has_terminal=True)
+        storage.open()
+        write_progress(progress_path, skip)
+
+    imported = 0
+    with open(args.path, 'r') as f:
+        for count, batch in read_batches(f, skip=skip, size=args.batch_size):
+            if args.dry_run:
+                for name, data in batch:
+                    print(name)
                 continue
 
-            data = f'{password}\n'
-            if 'username' in attributes:
-                data += f'username: {attributes.pop("username")}\n'
-            if 'URL' in attributes:
-                data += f'URL: {attributes.pop("URL")}\n'
-            if 'title' in attributes:
-                data += f'title: {attributes.pop("title")}\n'
-            for k, v in attributes.items():
-                data += f'{k}: {v}\n'
-
-            storage.insert(name, data)
+            if resumed:
+                batch = drop_imported(storage, batch)
+                resumed = False
+            imported += len(storage.insert_many(batch, workers=args.workers))
+            write_progress(progress_path, count)
+            print(f'\r{count} rows read, {imported} items imported', end='', file=sys.stderr)
+
+    if not args.dry_run:
+        print(file=sys.stderr)
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
 
 
 if __name__ == '__main__':
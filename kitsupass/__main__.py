@@ -1,17 +1,8 @@
-import argparse
-import getpass
 import os
-import subprocess
 import sys
-import uuid
 
-from importlib.resources import files
-from urllib.parse import parse_qs, urlparse
-
-import pyotp
-
-from .context import TMP
-from .storage import Storage
+# dependencies are imported by the commands which use them, so commands
+# such as version and help start fast, see tests/test_startup.py
 
 BIN_PATH = os.path.expanduser('~/.local/bin')
 SYSTEMD_PATH = os.path.expanduser('~/.config/systemd/user')
@@ -39,12 +30,16 @@ LOGO_TXT = '''
 
 
 def cmd_init():
+    from .storage import Storage
+
     storage = Storage(has_terminal=True)
     storage.create()
 
 
 def cmd_show():
-    storage = Storage(has_terminal=True)
+    from .agent import get_storage
+
+    storage = get_storage(has_terminal=True)
     storage.open()
     try:
         print(storage.show(sys.argv[2]))
@@ -53,28 +48,84 @@ def cmd_show():
 
 
 def cmd_otp():
-    storage = Storage(has_terminal=True)
+    import argparse
+    import time
+
+    from .agent import get_storage
+
+    parser = argparse.ArgumentParser(prog='kitsupass otp')
+    parser.add_argument('-a', '--all', action='store_true',
+                        help='show codes of every item with a TOTP field')
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help='show new codes as the old ones expire')
+    parser.add_argument('names', nargs='*')
+    args = parser.parse_args(sys.argv[2:])
+    if not args.all and not args.names:
+        parser.error('pass-name or --all is required')
+
+    storage = get_storage(has_terminal=True)
     storage.open()
-    item = storage.show(sys.argv[2])
-    for line in item.split('\n'):
-        if line.startswith('TOTP:'):
-            key, _, value = line.partition(':')
-            url = urlparse(value.strip())
-            query = parse_qs(url.query)
-            totp = pyotp.TOTP(query['secret'][0])
-            print(totp.now())
+
+    while True:
+        codes = storage.otp(None if args.all else args.names)
+        for code in codes:
+            if args.all or len(args.names) > 1:
+                print(f'{code["code"]}  {code["name"]}')
+            else:
+                print(code['code'])
+
+        if not args.watch or not codes:
+            return
+        try:
+            time.sleep(min(code['remaining'] for code in codes))
+        except KeyboardInterrupt:
+            return
+        print()
 
 
 def cmd_find():
-    name = sys.argv[2]
+    import argparse
+
+    from .agent import get_storage
+    from .search import get_matcher
+
+    parser = argparse.ArgumentParser(prog='kitsupass find')
+    parser.add_argument('-i', '--ignore-case', action='store_true')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--glob', dest='mode', action='store_const', const='glob',
+                      default='substring')
+    mode.add_argument('--regex', dest='mode', action='store_const', const='regex')
+    mode.add_argument('--fuzzy', dest='mode', action='store_const', const='fuzzy',
+                      help='list the best matches first')
+    parser.add_argument('-n', '--limit', type=int, default=0,
+                        help='maximum number of fuzzy matches')
+    parser.add_argument('names', nargs='+')
+    args = parser.parse_args(sys.argv[2:])
+
+    if args.mode == 'fuzzy':
+        storage = get_storage(has_terminal=True)
+        storage.open()
+        for item in storage.fuzzy(' '.join(args.names), args.limit):
+            print(item)
+        return
 
-    storage = Storage(has_terminal=True)
+    try:
+        get_matcher(args.names, args.mode, args.ignore_case)
+    except ValueError as e:
+        parser.error(str(e))
+
+    storage = get_storage(has_terminal=True)
     storage.open()
-    for item in storage.find(name):
-        print(item)
+    for item in storage.search(args.names, args.mode, args.ignore_case):
+        print(item, flush=True)
 
 
 def cmd_insert():
+    import subprocess
+
+    from .agent import get_storage
+    from .context import TMP
+
     name = sys.argv[2]
 
     with TMP() as tmp:
@@ -82,15 +133,20 @@ def cmd_insert():
         with open(tmp.name, 'r') as f:
             data = f.read()
 
-    storage = Storage(has_terminal=True)
+    storage = get_storage(has_terminal=True)
     storage.open()
     storage.insert(name, data)
 
 
 def cmd_edit():
+    import subprocess
+
+    from .agent import get_storage
+    from .context import TMP
+
     name = sys.argv[2]
 
-    storage = Storage(has_terminal=True)
+    storage = get_storage(has_terminal=True)
     storage.open()
 
     with TMP() as tmp:
@@ -101,38 +157,69 @@ def cmd_edit():
         with open(tmp.name, 'r') as f:
             data = f.read()
 
-    storage = Storage(has_terminal=True)
+    storage = get_storage(has_terminal=True)
     storage.open()
     storage.edit(name, data)
 
 
 def cmd_delete():
+    from .agent import get_storage
+
     name = sys.argv[2]
 
-    storage = Storage(has_terminal=True)
+    storage = get_storage(has_terminal=True)
     storage.open()
     storage.delete(name)
 
 
 def cmd_move():
+    from .agent import get_storage
+
     name = sys.argv[2]
     new_name = sys.argv[3]
 
-    storage = Storage(has_terminal=True)
+    storage = get_storage(has_terminal=True)
     storage.open()
     storage.move(name, new_name)
 
 
 def cmd_copy():
+    from .agent import get_storage
+
     name = sys.argv[2]
     new_name = sys.argv[3]
 
-    storage = Storage(has_terminal=True)
+    storage = get_storage(has_terminal=True)
     storage.open()
     storage.copy(name, new_name)
 
 
+def cmd_migrate():
+    from .agent import get_storage
+
+    storage = get_storage(has_terminal=True)
+    storage.open()
+    storage.migrate()
+
+
+def cmd_agent():
+    from .agent import Agent
+
+    agent = Agent()
+    agent.run()
+
+
+def cmd_lock():
+    from .agent import AgentStorage
+
+    storage = AgentStorage()
+    if storage.connect():
+        storage.close()
+
+
 def cmd_enable():
+    from importlib.resources import files
+
     name = sys.argv[2]
     if name == 'buttercup':
         filename = f'kitsupass-{name}.service'
@@ -174,12 +261,12 @@ def cmd_usage():
         Reencrypt existing password storage using a new password.
     kitsupass [ls] [subfolder]
         List passwords.
-    kitsupass find pass-names...
-    	List passwords that match pass-names.
+    kitsupass find [-i] [--glob | --regex | --fuzzy [-n limit]] pass-names...
+    	List passwords that match any of pass-names.
     kitsupass [show] pass-name
         Show existing password.
-    kitsupass otp pass-name
-        Generate an OTP code.
+    kitsupass otp [--watch] (--all | pass-names...)
+        Generate OTP codes, and new ones as they expire with --watch.
     kitsupass insert pass-name
         Insert new password using your preferred editor.
     kitsupass edit pass-name
@@ -190,6 +277,12 @@ def cmd_usage():
         Renames or moves old-path to new-path.
     kitsupass cp old-path new-path
         Copies old-path to new-path.
+    kitsupass migrate
+        Reencrypt the password storage using the latest format.
+    kitsupass agent
+        Run an agent which keeps the password storage unlocked.
+    kitsupass lock
+        Lock the password storage and stop the agent.
     kitsupass help
         Show this text.
     kitsupass version
@@ -218,17 +311,26 @@ def main():
             cmd_version()
         elif sys.argv[1] == 'otp':
             cmd_otp()
+        elif sys.argv[1] == 'migrate':
+            cmd_migrate()
+        elif sys.argv[1] == 'agent':
+            cmd_agent()
+        elif sys.argv[1] == 'lock':
+            cmd_lock()
         elif sys.argv[1] == 'enable':
             cmd_enable()
         elif sys.argv[1] == 'disable':
             cmd_disable()
         elif sys.argv[1] == 'buttercup':
             from .buttercup.api import app as buttercup_app
+            from .storage import Storage
             storage = Storage(has_gui=True)
             storage.open()
+            storage.watch()
             buttercup_app.create(storage=storage)
             buttercup_app.run()
             buttercup_app.close()
+            storage.unwatch()
         else:
             cmd_version()
             cmd_usage()
@@ -0,0 +1,320 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import time
+import types
+import uuid
+
+from . import exception
+from .entry import Entry
+
+AGENT_TIMEOUT = int(os.getenv('KITSUPASS_AGENT_TIMEOUT', 15 * 60))
+AGENT_START_TIMEOUT = 5
+
+
+def get_socket_path() -> str:
+    if path := os.getenv('KITSUPASS_AGENT_SOCK'):
+        return path
+
+    runtime_path = os.getenv('XDG_RUNTIME_DIR')
+    if runtime_path:
+        return os.path.join(runtime_path, 'kitsupass', 'agent.sock')
+    return os.path.join(os.getenv('TMPDIR', '/tmp'), f'kitsupass-{os.getuid()}', 'agent.sock')
+
+
+def check_folder(path: str, error: type = exception.UnsafeAgentError) -> None:
+    """
+    Make sure the socket folder belongs to the user and other users can't
+    write to it, so no one else can plant a socket to receive the password.
+    """
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise error
+
+
+def get_peer_uid(sock: socket.socket) -> int:
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', creds)
+    return uid
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request['command']
+            args = tuple(request.get('args', ()))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            response = {'error': 'StorageError'}
+        else:
+            response = self.server.dispatch(command, *args)
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class Agent(socketserver.UnixStreamServer):
+    """
+    Holds an unlocked storage and serves it over a per-user unix socket.
+    """
+    COMMANDS = (
+        'show',
+        'show_many',
+        'find',
+        'search',
+        'select',
+        'resolve',
+        'fuzzy',
+        'otp',
+        'list',
+        'tree',
+        'insert',
+        'insert_many',
+        'edit',
+        'delete',
+        'move',
+        'copy',
+        'migrate',
+    )
+
+    def __init__(self, path: str | None = None, timeout: int = AGENT_TIMEOUT):
+        from .storage import Storage
+
+        self.path = path or get_socket_path()
+        self.storage = Storage()
+        self.timeout = timeout
+        self.running = False
+
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        check_folder(os.path.dirname(self.path))
+        if os.path.exists(self.path):
+            # only a socket left by an agent which is not running is removed
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                try:
+                    sock.connect(self.path)
+                except ConnectionRefusedError:
+                    os.remove(self.path)
+                else:
+                    raise exception.RunningAgentError
+
+        super().__init__(self.path, AgentHandler)
+        os.chmod(self.path, 0o600)
+
+    def verify_request(self, request, client_address) -> bool:
+        return get_peer_uid(request) == os.getuid()
+
+    def dispatch(self, command: str, *args) -> dict:
+        try:
+            if command == 'ping':
+                result = self.storage.is_open
+
+            elif command == 'open':
+                if not self.storage.is_open:
+                    self.storage.open()
+                result = str(self.storage.id)
+
+            elif command == 'unlock':
+                self.storage.open(*args)
+                result = str(self.storage.id)
+
+            elif command == 'lock':
+                self.lock()
+                result = None
+
+            elif command in self.COMMANDS:
+                if not self.storage.is_open:
+                    raise exception.LockedStorageError
+
+                result = getattr(self.storage, command)(*args)
+                if isinstance(result, types.GeneratorType):
+                    result = list(result)
+
+            else:
+                raise exception.StorageError
+
+        except Exception as e:
+            # unknown errors are raised as StorageError by the client
+            return {'error': e.__class__.__name__}
+
+        return {'result': result}
+
+    def lock(self):
+        if self.storage.is_open:
+            self.storage.close()
+        self.running = False
+
+    def handle_timeout(self):
+        self.running = False
+
+    def run(self):
+        self.running = True
+        self.storage.watch()
+        try:
+            while self.running:
+                self.handle_request()
+        finally:
+            self.storage.unwatch()
+            self.storage.password = None
+            self.storage.key = None
+            self.server_close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class AgentStorage:
+    """
+    Storage proxy which forwards every call to a running agent.
+    """
+
+    def __init__(self, has_terminal: bool = False, has_gui: bool = False):
+        self.has_terminal = has_terminal
+        self.has_gui = has_gui
+        self.path = get_socket_path()
+        self.id = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.call('ping')
+
+    def call(self, command: str, *args):
+        check_folder(os.path.dirname(self.path))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            # the password may be sent, so the agent must be run by the user
+            if get_peer_uid(sock) != os.getuid():
+                raise exception.UnsafeAgentError
+            sock.sendall(json.dumps({
+                'command': command,
+                'args': args,
+            }).encode() + b'\n')
+            with sock.makefile('rb') as f:
+                response = json.loads(f.readline())
+
+        if 'error' in response:
+            raise getattr(exception, response['error'], exception.StorageError)
+        return response['result']
+
+    def connect(self, autostart: bool = False) -> bool:
+        try:
+            self.call('ping')
+            return True
+        except exception.UnsafeAgentError:
+            return False
+        except (OSError, ValueError):
+            if not autostart:
+                return False
+
+        import subprocess
+        subprocess.Popen(
+            [sys.executable, '-m', 'kitsupass', 'agent'],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+        deadline = time.monotonic() + AGENT_START_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            try:
+                self.call('ping')
+                return True
+            except (OSError, ValueError):
+                pass
+        return False
+
+    def open(self):
+        try:
+            self.id = uuid.UUID(self.call('open'))
+        except exception.InvalidPasswordStorageError:
+            from .prompt import ask_password
+
+            password = ask_password(
+                'Enter the primary vault password', self.has_terminal, self.has_gui)
+            if not password:
+                raise
+            self.id = uuid.UUID(self.call('unlock', password))
+
+    def close(self):
+        self.call('lock')
+
+    def insert(self, name: str, data: str) -> None:
+        self.call('insert', name, data)
+
+    def insert_many(self, items, workers: int | None = None) -> list[str]:
+        return self.call('insert_many', tuple(items), workers)
+
+    def edit(self, name: str, data: str) -> None:
+        self.call('edit', name, data)
+
+    def show(self, name: str = '') -> str:
+        return self.call('show', name)
+
+    def iter_decrypted(self, names, workers: int | None = None):
+        names = tuple(names)
+        yield from zip(names, self.show_many(names, workers))
+
+    def show_many(self, names, workers: int | None = None) -> list[str]:
+        return self.call('show_many', tuple(names), workers)
+
+    def entry(self, name: str) -> Entry:
+        return Entry(self.show(name))
+
+    def iter_entries(self, names, workers: int | None = None):
+        for name, text in self.iter_decrypted(names, workers):
+            yield name, Entry(text)
+
+    def entries(self, names, workers: int | None = None) -> list[Entry]:
+        return [Entry(text) for text in self.show_many(names, workers)]
+
+    def delete(self, name: str) -> None:
+        self.call('delete', name)
+
+    def move(self, name: str, new_name: str) -> None:
+        self.call('move', name, new_name)
+
+    def copy(self, name: str, new_name: str) -> None:
+        self.call('copy', name, new_name)
+
+    def find(self, name: str = ''):
+        yield from self.call('find', name)
+
+    def search(self, patterns, mode: str = 'substring', ignore_case: bool = False):
+        yield from self.call('search', tuple(patterns), mode, ignore_case)
+
+    def select(self, names) -> list[str]:
+        return self.call('select', tuple(names))
+
+    def resolve(self, name: str, username: str, workers: int | None = None) -> str | None:
+        return self.call('resolve', name, username, workers)
+
+    def fuzzy(self, pattern: str, limit: int = 0) -> list[str]:
+        return self.call('fuzzy', pattern, limit)
+
+    def otp(self, names=None, codes: bool = True) -> list[dict]:
+        return self.call('otp', None if names is None else tuple(names), codes)
+
+    def list(self, name: str = '') -> tuple[list[str], list[str]]:
+        folders, items = self.call('list', name)
+        return folders, items
+
+    def tree(self, name: str = '') -> str:
+        return self.call('tree', name)
+
+    def migrate(self) -> None:
+        self.call('migrate')
+
+
+def get_storage(has_terminal: bool = False, has_gui: bool = False):
+    """
+    Get an agent backed storage if the agent is running or enabled with
+    KITSUPASS_AGENT, or a local storage otherwise.
+    """
+    storage = AgentStorage(has_terminal=has_terminal, has_gui=has_gui)
+    if storage.connect(autostart=bool(os.getenv('KITSUPASS_AGENT'))):
+        return storage
+
+    from .storage import Storage
+    return Storage(has_terminal=has_terminal, has_gui=has_gui)
@@ -7,9 +7,10 @@ import sys
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk
 
+from .entry import Entry
 from .exception import NotFoundStorageError
 from .getpass import getpass
-from .storage import Storage
+from .agent import get_storage
 
 RESPONSE_TYPE_RESET = 1
 RESPONSE_TYPE_SAVE = 2
@@ -39,19 +40,12 @@ def confirm(request):
 
 
 def fetchpass(request, name, storage, username=None, keypath=None):
-    names = tuple(storage.find(name))
-    if username:
-        for cur_name in names:
-            item = storage.show(cur_name)
-            for line in item.split('\n'):
-                if line.startswith('username:'):
-                    k, _, v = line.partition(':')
-                    if username == v.strip():
-                        break
-        else:
-            item = storage.show((names + (name,))[0])
+    if username and (path := storage.resolve(name, username)):
+        entry = storage.entry(path)
+    elif username:
+        entry = storage.entry((tuple(storage.find(name)) + (name,))[0])
     else:
-        item = storage.show(name)
+        entry = storage.entry(name)
 
     dialog = Gtk.MessageDialog(
         message_type=Gtk.MessageType.QUESTION,
@@ -67,7 +61,7 @@ def fetchpass(request, name, storage, username=None, keypath=None):
     dialog.destroy()
 
     if response == Gtk.ResponseType.YES:
-        print(item.split('\n')[0])
+        print(entry.password)
         sys.exit(0)
 
     elif response == Gtk.ResponseType.NO:
@@ -79,7 +73,7 @@ def fetchpass(request, name, storage, username=None, keypath=None):
 
     elif response == RESPONSE_TYPE_SAVE:
         subprocess.run(['ssh-add', keypath])
-        print(item.split('\n')[0])
+        print(entry.password)
         sys.exit(0)
 
 
@@ -87,10 +81,7 @@ def askpass(request, name=None, storage=None, username=None):
     password = getpass('SSH', request)
     if password:
         if name and storage:
-            data = password
-            if username:
-                data += f'\nusername: {username}'
-            storage.insert(name, data)
+            storage.insert(name, str(Entry.create(password, {'username': username})))
 
         sys.exit(0)
 
@@ -99,7 +90,7 @@ def askpass(request, name=None, storage=None, username=None):
 
 
 def checkpass(request, name, username=None, keypath=None):
-    storage = Storage(has_gui=True)
+    storage = get_storage(has_gui=True)
     storage.open()
 
     try:
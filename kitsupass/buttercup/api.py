@@ -1,7 +1,8 @@
+import base64
+import bisect
 import random
 import string
 
-from urllib.parse import urlparse, urlunparse
 
 from bottle import Bottle, request, abort
 from jwskate import Jwk
@@ -9,6 +10,7 @@ from gi.repository import Notify
 
 from .. import exception
 from .application import app
+from .auth import resetSession
 from .config import getConfigValue, setConfigValue
 from .models import (
     AuthRequestSchema,
@@ -17,16 +19,60 @@ from .models import (
     SaveNewEntryPayloadSchema,
     TermEntriesSearchQuerySchema,
     UrlEntriesSearchQuerySchema,
+    VaultsTreeQuerySchema,
 )
 from .middleware import requireClient, requireKeyAuth
-from .response import respondJSON
+from .response import makeETag, notModified, respondJSON
+from .search import getDomainIndex
 from .symbols import API_KEY_ALGO, API_KEY_CURVE, FACADE_VERSION
 
 
-def _get_items(names):
+def _paginate(names, limit: int = 0, cursor: str = '') -> tuple[list, str | None]:
+    """
+    Get sorted names following the cursor and a cursor of the next page.
+    """
+    names = sorted(set(names))
+    if cursor:
+        after = base64.urlsafe_b64decode(cursor.encode()).decode()
+        names = names[bisect.bisect_right(names, after):]
+
+    if limit and len(names) > limit:
+        names = names[:limit]
+        return names, base64.urlsafe_b64encode(names[-1].encode()).decode()
+    return names, None
+
+
+def _paginate_ranked(search, limit: int = 0, cursor: str = '') -> tuple[list, str | None]:
+    """
+    Get names ranked by search(limit) following the cursor, which is the
+    offset of the page, and a cursor of the next page.
+    """
+    offset = int(base64.urlsafe_b64decode(cursor.encode()).decode()) if cursor else 0
+    if not limit:
+        return search(0)[offset:], None
+
+    names = search(offset + limit + 1)
+    cursor = None
+    if len(names) > offset + limit:
+        cursor = base64.urlsafe_b64encode(str(offset + limit).encode()).decode()
+    return names[offset:offset + limit], cursor
+
+
+def _get_items(names, metadataOnly: bool = False):
     results = []
 
-    for name in names:
+    names = tuple(names)
+    entries = (None,) * len(names)
+    metas = (None,) * len(names)
+    try:
+        if metadataOnly:
+            metas = [app.storage.meta(name) for name in names]
+        else:
+            entries = app.storage.entries(names)
+    except exception.LockedStorageError:
+        pass
+
+    for name, entry, meta in zip(names, entries, metas):
         result = {
             'entryType': 'website',
             'groupID': '0',
@@ -41,21 +87,17 @@ def _get_items(names):
             'vaultID': str(app.storage.id),
         }
 
-        try:
-            item = app.storage.show(name)
-            lines = item.split('\n')
-            result['properties']['password'] = lines[0].strip()
-            for line in lines[1:]:
-                if line.startswith('URL: '):
-                    result['properties']['URL'] = line.partition(':')[2].strip()
-                # elif line.startswith('title: '):
-                #     result['properties']['title'] = line.partition(':')[2]
-                elif line.startswith('username: '):
-                    result['properties']['username'] = line.partition(':')[2].strip()
-                else:
-                    result['properties']['Note'] += f'{line}\n'
-        except exception.LockedStorageError:
-            pass
+        if meta is not None:
+            for key in ('URL', 'username'):
+                if key in meta:
+                    result['properties'][key] = meta[key]
+
+        if entry is not None:
+            result['properties']['password'] = entry.password.strip()
+            for key in ('URL', 'username'):
+                if key in entry:
+                    result['properties'][key] = entry[key]
+            result['properties']['Note'] = entry.notes(exclude=('URL', 'username'))
 
         results.append(result)
 
@@ -93,12 +135,12 @@ def processAuthResponse(request=request):
     except ValueError as e:
         return abort(400, str(e))
 
-    if app.auth_code and app.auth_code == s.code:
-        app.set_code()
+    if app.use_code(s.code):
         clients = getConfigValue('browserClients') or {}
         setConfigValue('browserClients', clients | {
             s.id: s.get_public_key_jwk().to_dict(),
         })
+        resetSession(s.id)
         return {
     	    'publicKey': Jwk(getConfigValue('browserPublicKey')).to_json(),
         }
@@ -124,22 +166,23 @@ def searchEntries(request=request):
     except ValueError as e:
         return abort(400, str(e))
 
-    names = []
-
-    if s.type == 'term':
-        names = app.storage.find(s.term)
+    try:
+        if s.type == 'term':
+            names, cursor = _paginate_ranked(
+                lambda limit: app.storage.fuzzy(s.term, limit), s.limit, s.cursor)
 
-    if s.type == 'url':
-        names = tuple()
-        url = urlparse(s.url)
-        domain = url.netloc
-        while not names and '.' in domain:
-            names = tuple(app.storage.find(domain))
-            domain = domain.partition('.')[2]
+        if s.type == 'url':
+            names, cursor = _paginate_ranked(
+                lambda limit: getDomainIndex(app.storage).lookup(s.url), s.limit, s.cursor)
+    except ValueError:
+        return abort(400, 'cursor')
 
-    return respondJSON(request, {
-        'results': _get_items(names),
-    })
+    response = {
+        'results': _get_items(names, metadataOnly=s.metadataOnly),
+    }
+    if cursor:
+        response['nextCursor'] = cursor
+    return respondJSON(request, response)
 
 
 @app.post('/v1/entries/specific')
@@ -150,13 +193,13 @@ def searchSpecificEntries(request=request):
         s = EntriesSearchBodySchema(**request.json)
     except ValueError as e:
         return abort(400, str(e))
-    names = []
 
-    for entry in s.entries:
-        if entry.sourceID == str(app.storage.id):
-            similar_names = tuple(app.storage.find(entry.entryID))
-            if s.entryID in similar_names:
-                names.append(entry.entryID)
+    names = [entry.entryID for entry in s.entries if entry.sourceID == str(app.storage.id)]
+    try:
+        names = app.storage.select(names)
+    except exception.LockedStorageError:
+        existing = set(app.storage.find())
+        names = [name for name in dict.fromkeys(names) if name in existing]
 
     return respondJSON(request, {
         'results': _get_items(names),
@@ -166,29 +209,20 @@ def searchSpecificEntries(request=request):
 @app.get('/v1/otps')
 @requireClient
 def getAllOTPs(request=request):
-    results = []
-    for name in app.storage.find('otp:'):
-        result = {
-            'sourceID': str(app.storage.id),
-            'entryID': name,
-            'entryProperty': 'TOTP',
-            'entryTitle': name,
-            'loginURL': None,
-            'otpURL': None,
-        }
-
-        try:
-            item = app.storage.show(name)
-            lines = item.split('\n')
-            for line in lines[1:]:
-                if line.startswith('URL: '):
-                    result['loginURL'] = line.partition(':')[2].strip()
-                elif line.startswith('TOTP: '):
-                    result['otpURL'] = line.partition(':')[2].strip()
-        except exception.LockedStorageError:
-            pass
-
-        results.append(result)
+    try:
+        items = app.storage.otp(codes=False)
+    except exception.LockedStorageError:
+        # items with TOTP fields are not known while the storage is locked
+        items = [{'name': name, 'TOTP': None, 'URL': None} for name in app.storage.find('otp:')]
+
+    results = [{
+        'sourceID': str(app.storage.id),
+        'entryID': item['name'],
+        'entryProperty': 'TOTP',
+        'entryTitle': item['name'],
+        'loginURL': item['URL'],
+        'otpURL': item['TOTP'],
+    } for item in items]
 
     return respondJSON(request, {
         'otps': results,
@@ -198,6 +232,10 @@ def getAllOTPs(request=request):
 @app.get('/v1/vaults')
 @requireClient
 def getVaults(request=request):
+    etag = makeETag(str(app.storage.id), app.storage.is_open)
+    if response := notModified(request, etag):
+        return response
+
     return respondJSON(request, {
         'sources': [{
             'id': str(app.storage.id),
@@ -207,13 +245,28 @@ def getVaults(request=request):
             'order': 0,
             'format': 'a',
         }],
-    })
+    }, etag=etag)
 
 
 @app.get('/v1/vaults-tree')
 @requireClient
 def getVaultsTree(request=request):
-    return respondJSON(request, {
+    try:
+        s = VaultsTreeQuerySchema(**dict(request.GET))
+    except ValueError as e:
+        return abort(400, str(e))
+
+    etag = makeETag(
+        str(app.storage.id), app.storage.is_open, app.storage.generation, s.limit, s.cursor)
+    if response := notModified(request, etag):
+        return response
+
+    try:
+        names, cursor = _paginate(app.storage.find(), s.limit, s.cursor)
+    except ValueError as e:
+        return abort(400, str(e))
+
+    response = {
         'tree': {
             str(app.storage.id): {
                 '_tag': str(app.storage.id),
@@ -232,13 +285,16 @@ def getVaultsTree(request=request):
                     'id': item,
                     'type': 'website',
                     'parentID': '0',
-                } for item in app.storage.find()],
+                } for item in names],
             }
         },
         'names': {
             str(app.storage.id): app.storage.__class__.__name__,
         },
-    })
+    }
+    if cursor:
+        response['nextCursor'] = cursor
+    return respondJSON(request, response, etag=etag)
 
 
 @app.post('/v1/vaults/<id>/group/<gid>/entry')
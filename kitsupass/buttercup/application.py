@@ -1,3 +1,10 @@
+import functools
+import io
+import threading
+
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
+
 from gi.repository import Notify
 
 # import secretstorage
@@ -6,9 +13,90 @@ from bottle import Bottle
 # from jeepney.io.blocking import DBusConnection
 
 from .auth import generateBrowserKeys
-from .symbols import BROWSER_API_HOST_PORT
+from .symbols import BROWSER_API_HOST_PORT, BROWSER_API_THREADS
 from ..storage import Storage
 
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class KeepAliveServerHandler(ServerHandler):
+    http_version = '1.1'
+
+    def cleanup_headers(self) -> None:
+        super().cleanup_headers()
+        handler = self.request_handler
+        # without a length the response ends with the connection
+        if 'Content-Length' not in self.headers:
+            handler.close_connection = True
+        if handler.close_connection:
+            self.headers['Connection'] = 'close'
+        elif handler.request_version == 'HTTP/1.0':
+            self.headers['Connection'] = 'keep-alive'
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    Request handler of the wsgiref server keeping HTTP/1.1 connections open
+    between requests, as waitress does.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, *args, quiet: bool = False):
+        self.quiet = quiet
+        super().__init__(*args)
+
+    def address_string(self) -> str:
+        # no reverse DNS lookups
+        return self.client_address[0]
+
+    def log_request(self, *args) -> None:
+        if not self.quiet:
+            super().log_request(*args)
+
+    def handle(self) -> None:
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self) -> None:
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+
+        # read the whole body, so the next request starts where it ends
+        # even if the application doesn't read it
+        stdin = self.rfile
+        if 'Transfer-Encoding' in self.headers:
+            self.close_connection = True
+        else:
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                self.send_error(400, 'Bad Content-Length')
+                return
+            stdin = io.BytesIO(self.rfile.read(length))
+
+        handler = KeepAliveServerHandler(
+            stdin, self.wfile, self.get_stderr(), self.get_environ(), multithread=True)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+        self.wfile.flush()
+
 
 class Application(Bottle):
     storage: Storage | None
@@ -20,21 +108,43 @@ class Application(Bottle):
         super().__init__()
         self.auth_code = None
         self.storage = None
+        self.lock = threading.Lock()
         appid = f'{self.__class__.__module__}.{self.__class__.__name__}'
         Notify.init(appid)
 
     def set_code(self, code: str = None) -> None:
-        del self.auth_code
-        self.auth_code = code
+        with self.lock:
+            del self.auth_code
+            self.auth_code = code
+
+    def use_code(self, code: str) -> bool:
+        """
+        Check the authorisation code and reset it, so it is used only once.
+        """
+        with self.lock:
+            if not self.auth_code or self.auth_code != code:
+                return False
+            del self.auth_code
+            self.auth_code = None
+            return True
 
     def create(self, storage: Storage) -> None:
         del self.storage
         self.storage = storage
 
-    def run(self) -> None:
+    def run(self, port: int = BROWSER_API_HOST_PORT, quiet: bool = False) -> None:
         generateBrowserKeys()
         # self.dbus_connection = secretstorage.dbus_init()
-        super().run(host='localhost', port=BROWSER_API_HOST_PORT)
+        if waitress:
+            # HTTP/1.1 with keep-alive connections
+            super().run(
+                host='localhost', port=port, quiet=quiet,
+                server='waitress', threads=BROWSER_API_THREADS)
+        else:
+            super().run(
+                host='localhost', port=port, quiet=quiet,
+                server='wsgiref', server_class=ThreadingWSGIServer,
+                handler_class=functools.partial(KeepAliveRequestHandler, quiet=quiet))
 
     def close(self):
         # self.dbus_connection.close()
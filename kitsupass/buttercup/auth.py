@@ -1,8 +1,10 @@
 import base64
 import codecs
+import collections
 import os
 import random
 import string
+import threading
 
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import ec
@@ -13,6 +15,10 @@ from jwskate import Jwk
 from .config import getConfigValue, setConfigValue
 from .symbols import API_KEY_ALGO, API_KEY_CURVE
 
+SESSION_KEYS_SIZE = 32
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
 
 def generateBrowserKeys():
     privateKeyData = getConfigValue('browserPrivateKey')
@@ -33,48 +39,88 @@ def deriveSecretKey(privateKey: dict, publicKey: dict) -> bytes:
     return codecs.encode(secret, 'hex')
 
 
-def decryptAPIPayload(clientID, payload: str) -> bytes:
-    clients = getConfigValue('browserClients')
-    clientConfig = clients[clientID]
+class Session:
+    """
+    Shared secret of a browser client and an LRU cache of keys derived from
+    it, so the ECDH exchange and PBKDF2 run once per client and salt.
+    """
+
+    def __init__(self, clientConfig: dict, browserPrivateKey: dict):
+        self.clientConfig = clientConfig
+        self.browserPrivateKey = browserPrivateKey
+        self.secret = deriveSecretKey(browserPrivateKey, clientConfig)
+        self.salt = ''.join([random.choice(string.ascii_letters) for i in range(12)])
+        self.keys = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def deriveKey(self, salt: str, rounds: int) -> bytes:
+        with self.lock:
+            if key := self.keys.get((salt, rounds)):
+                self.keys.move_to_end((salt, rounds))
+                return key
+
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=256 // 8,
+            salt=salt.encode(),
+            iterations=rounds,
+        )
+        key = kdf.derive(self.secret)
+
+        with self.lock:
+            self.keys[(salt, rounds)] = key
+            while len(self.keys) > SESSION_KEYS_SIZE:
+                self.keys.popitem(last=False)
+        return key
+
+
+def getSession(clientID) -> Session:
+    clientConfig = getConfigValue('browserClients')[clientID]
     browserPrivateKey = getConfigValue('browserPrivateKey')
-    secret = deriveSecretKey(browserPrivateKey, clientConfig)
 
+    with SESSIONS_LOCK:
+        session = SESSIONS.get(clientID)
+        if session is None or \
+                session.clientConfig != clientConfig or \
+                session.browserPrivateKey != browserPrivateKey:
+            session = SESSIONS[clientID] = Session(clientConfig, browserPrivateKey)
+        return session
+
+
+def resetSession(clientID) -> None:
+    with SESSIONS_LOCK:
+        SESSIONS.pop(clientID, None)
+
+
+def decryptAPIPayload(clientID, payload: str) -> bytes:
+    return decryptSessionPayload(getSession(clientID), payload)
+
+
+def encryptAPIPayload(clientID, payload: bytes) -> str:
+    return encryptSessionPayload(getSession(clientID), payload)
+
+
+def decryptSessionPayload(session: Session, payload: str) -> bytes:
     content, iv, salt, auth, roundsRaw, methodRaw = payload.split('$')
     method = getattr(modes, methodRaw.upper())
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=256 // 8,
-        salt=salt.encode(),
-        iterations=int(roundsRaw),
-    )
 
     decryptor = Cipher(
-        algorithms.AES(kdf.derive(secret)),
+        algorithms.AES(session.deriveKey(salt, int(roundsRaw))),
         method(codecs.decode(iv, 'hex'), tag=codecs.decode(auth, 'hex')),
     ).decryptor()
     decryptor.authenticate_additional_data(f'{iv}{salt}'.encode())
     return decryptor.update(base64.b64decode(content)) + decryptor.finalize()
 
 
-def encryptAPIPayload(clientID, payload: bytes) -> str:
-    clients = getConfigValue('browserClients')
-    clientConfig = clients[clientID]
-    browserPrivateKey = getConfigValue('browserPrivateKey')
-    secret = deriveSecretKey(browserPrivateKey, clientConfig)
-
+def encryptSessionPayload(session: Session, payload: bytes) -> str:
     iv = codecs.encode(os.urandom(16), 'hex').decode()
-    salt = ''.join([random.choice(string.ascii_letters) for i in range(12)])
+    # the salt is kept for the session and the IV is random for every payload
+    salt = session.salt
     rounds = 100000
     method = modes.GCM
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=256 // 8,
-        salt=salt.encode(),
-        iterations=rounds,
-    )
 
     encryptor = Cipher(
-        algorithms.AES(kdf.derive(secret)),
+        algorithms.AES(session.deriveKey(salt, rounds)),
         method(codecs.decode(iv, 'hex')),
     ).encryptor()
     encryptor.authenticate_additional_data(f'{iv}{salt}'.encode())
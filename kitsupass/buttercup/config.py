@@ -1,8 +1,10 @@
 import json
 import os
+import threading
 
 CONFIG_PATH = os.path.expanduser('~/.config/buttercup-keyring-server.json')
 CONFIG = {}
+CONFIG_LOCK = threading.RLock()
 try:
     with open(CONFIG_PATH, 'r') as f:
         CONFIG = json.load(f)
@@ -11,14 +13,16 @@ except IOError:
 
 
 def getConfigValue(key):
-    return CONFIG.get(key)
+    with CONFIG_LOCK:
+        return CONFIG.get(key)
 
 
 def setConfigValue(key, value):
-    CONFIG[key] = value
+    with CONFIG_LOCK:
+        CONFIG[key] = value
 
-    try:
-        with open(CONFIG_PATH, 'w') as f:
-            json.dump(CONFIG, f, indent=4)
-    except IOError:
-        pass
+        try:
+            with open(CONFIG_PATH, 'w') as f:
+                json.dump(CONFIG, f, indent=4)
+        except IOError:
+            pass
@@ -5,6 +5,8 @@ from types import GenericAlias
 from jwskate import Jwk
 
 ULID = r'^[A-Z0-9]{26}$'
+# query string values of boolean parameters
+BOOLEANS = {'true': True, '1': True, 'false': False, '0': False}
 
 
 def get_annotations(obj):
@@ -15,6 +17,14 @@ def get_annotations(obj):
     return {}
 
 
+def parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    try:
+        return BOOLEANS[str(value).lower()]
+    except KeyError:
+        raise ValueError(value) from None
+
 
 class AnySchema:
     def __init__(self, *schemas):
@@ -42,6 +52,9 @@ class Schema(metaclass=SchemaMeta):
                     varsubtype = vartype.__args__[0]
                     value = [varsubtype(**i) for i in value]
 
+                elif vartype is bool:
+                    value = parse_bool(value)
+
                 elif type(value) != vartype:
                     value = vartype(value)
 
@@ -82,11 +95,22 @@ class AuthResponseSchema(Schema):
 class TermEntriesSearchQuerySchema(Schema):
     term: str
     type: str = 'term'
+    limit: int = 0
+    cursor: str = ''
+    metadataOnly: bool = False
 
 
 class UrlEntriesSearchQuerySchema(Schema):
     url: str
     type: str = 'url'
+    limit: int = 0
+    cursor: str = ''
+    metadataOnly: bool = False
+
+
+class VaultsTreeQuerySchema(Schema):
+    limit: int = 0
+    cursor: str = ''
 
 
 class EntrySchema(Schema):
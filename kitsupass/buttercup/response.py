@@ -1,11 +1,31 @@
+import hashlib
 import json
+import os
 
 from bottle import abort, HTTPResponse
 
 from .auth import encryptAPIPayload
 
+BOOT_ID = os.urandom(8).hex()
 
-def respondJSON(request, obj: dict):
+
+def makeETag(*parts) -> str:
+    """
+    Get an entity tag of a response built from the given state, which
+    differs between runs of the server.
+    """
+    digest = hashlib.sha256(repr((BOOT_ID,) + parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def notModified(request, etag: str) -> HTTPResponse | None:
+    header = request.get_header('If-None-Match') or ''
+    tags = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    if etag in tags or '*' in tags:
+        return HTTPResponse(status=304, headers={'ETag': etag})
+
+
+def respondJSON(request, obj: dict, etag: str | None = None):
     clientID = request.clientID
     if not clientID:
         return abort(403, 'No client ID set: Invalid response state')
@@ -16,4 +36,6 @@ def respondJSON(request, obj: dict):
         'Content-Type': 'text/plain',
         'X-Content-Type': 'application/json',
     }
+    if etag:
+        headers['ETag'] = etag
     return HTTPResponse(status=200, body=data.encode(), headers=headers)
@@ -0,0 +1,164 @@
+import functools
+import ipaddress
+import os
+import re
+import threading
+
+from importlib.resources import files
+from urllib.parse import urlparse
+
+from .. import exception
+from .symbols import PUBLIC_SUFFIX_LIST_PATH
+
+HOST_RE = re.compile(r'^[a-z0-9-]+(\.[a-z0-9-]+)+$')
+# suffix of names of imported items which collided with existing ones
+DUPLICATE_RE = re.compile(r' \(\d+\)$')
+
+
+@functools.cache
+def loadPublicSuffixes() -> tuple[frozenset, frozenset]:
+    """
+    Get rules and exception rules of the public suffix list of the system,
+    or of the trimmed copy bundled with the package.
+    """
+    if os.path.exists(PUBLIC_SUFFIX_LIST_PATH):
+        with open(PUBLIC_SUFFIX_LIST_PATH, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = (files('kitsupass.buttercup') / 'public_suffix_list.dat').read_text('utf-8')
+
+    rules = set()
+    exceptions = set()
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        rule = line.split()[0].lower()
+        if rule.startswith('!'):
+            exceptions.add(rule[1:])
+        else:
+            rules.add(rule)
+    return frozenset(rules), frozenset(exceptions)
+
+
+def getRegistrableDomain(host: str) -> str:
+    """
+    Get the public suffix of a host plus one label, e.g. example.co.uk for
+    mail.example.co.uk, or the host itself if it's an IP address or
+    a public suffix.
+    """
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+
+    rules, exceptions = loadPublicSuffixes()
+    labels = host.split('.')
+    # the default rule is *
+    size = 1
+    for i in range(len(labels) - 1, -1, -1):
+        suffix = '.'.join(labels[i:])
+        if suffix in exceptions:
+            size = len(labels) - i - 1
+            break
+        if suffix in rules or '.'.join(['*'] + labels[i + 1:]) in rules:
+            size = len(labels) - i
+
+    if size >= len(labels):
+        return host
+    return '.'.join(labels[-size - 1:])
+
+
+def getHost(url: str) -> str | None:
+    """
+    Get the lowercase host name of a URL, which may lack the scheme.
+    """
+    if '://' not in url:
+        url = f'https://{url}'
+    try:
+        host = urlparse(url.strip()).hostname
+    except ValueError:
+        return None
+    if host:
+        return host.rstrip('.')
+
+
+def getNameHost(name: str) -> str | None:
+    """
+    Get a host from the name of an item, e.g. `login.example.com (2)` of
+    `web/login.example.com (2)`.
+    """
+    name = DUPLICATE_RE.sub('', os.path.basename(name)).lower()
+    name = name.rpartition('@')[2]
+    name = re.sub(r':\d+$', '', name)
+    if HOST_RE.match(name):
+        return name
+
+
+class DomainIndex:
+    """
+    Map of registrable domains to items and their host names, which are
+    taken from item names and their URL fields.
+    """
+
+    def __init__(self, items):
+        self.domains = {}
+        for name, meta in items:
+            hosts = {getNameHost(name)}
+            if url := meta.get('URL'):
+                hosts.add(getHost(url))
+            for host in hosts - {None}:
+                domain = getRegistrableDomain(host)
+                self.domains.setdefault(domain, {}).setdefault(name, set()).add(host)
+
+    def lookup(self, url: str) -> list[str]:
+        """
+        Get names of items of the registrable domain of the URL, ranked by
+        how many trailing labels of their host names match the URL host.
+        """
+        host = getHost(url)
+        if not host:
+            return []
+
+        labels = host.split('.')
+        items = self.domains.get(getRegistrableDomain(host), {})
+
+        def rank(name: str) -> tuple:
+            best = 0
+            for item_host in items[name]:
+                item_labels = item_host.split('.')
+                if item_labels == labels:
+                    return (-len(labels) - 1, name)
+                common = 0
+                while common < min(len(labels), len(item_labels)) and \
+                        labels[-common - 1] == item_labels[-common - 1]:
+                    common += 1
+                best = max(best, common)
+            return (-best, name)
+
+        return sorted(items, key=rank)
+
+
+DOMAIN_INDEXES = {}
+DOMAIN_INDEXES_LOCK = threading.Lock()
+
+
+def getDomainIndex(storage) -> DomainIndex:
+    """
+    Get the domain index of a storage, which is rebuilt from the storage
+    index when the storage changes.
+    """
+    def getMeta(name: str) -> dict:
+        try:
+            return storage.meta(name)
+        except exception.StorageError:
+            return {}
+
+    # URL fields are not known while the storage is locked
+    key = (str(storage.id), storage.is_open, storage.generation)
+    with DOMAIN_INDEXES_LOCK:
+        if key not in DOMAIN_INDEXES:
+            DOMAIN_INDEXES.clear()
+            DOMAIN_INDEXES[key] = DomainIndex((name, getMeta(name)) for name in storage.find())
+        return DOMAIN_INDEXES[key]
@@ -1,4 +1,6 @@
 API_KEY_ALGO = 'ECDH'
 API_KEY_CURVE = 'P-256'
 BROWSER_API_HOST_PORT = 12822
+BROWSER_API_THREADS = 8
 FACADE_VERSION = 2
+PUBLIC_SUFFIX_LIST_PATH = '/usr/share/publicsuffix/public_suffix_list.dat'
@@ -0,0 +1,73 @@
+import collections
+import os
+import threading
+import time
+
+from .entry import Entry
+
+CACHE_SIZE = int(os.getenv('KITSUPASS_CACHE_SIZE', 128))
+CACHE_TTL = int(os.getenv('KITSUPASS_CACHE_TTL', 5 * 60))
+
+
+class Cache:
+    """
+    LRU cache of decrypted entries.
+
+    Items are stored by path along with the inode and the modification time
+    of the file, so a file changed by another program is never served from
+    the cache.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE, ttl: int = CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def get(self, path: str, stat: os.stat_result) -> Entry | None:
+        with self.lock:
+            if item := self.items.get(path):
+                version, expires, entry = item
+                if version == (stat.st_ino, stat.st_mtime_ns) and expires > time.monotonic():
+                    self.items.move_to_end(path)
+                    self.hits += 1
+                    return entry
+                del self.items[path]
+
+            self.misses += 1
+
+    def put(self, path: str, stat: os.stat_result, entry: Entry) -> None:
+        if not self.size:
+            return
+
+        with self.lock:
+            self.items[path] = (
+                (stat.st_ino, stat.st_mtime_ns),
+                time.monotonic() + self.ttl,
+                entry,
+            )
+            self.items.move_to_end(path)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def invalidate(self, path: str) -> None:
+        with self.lock:
+            self.items.pop(path, None)
+
+    def invalidate_folder(self, path: str) -> None:
+        prefix = os.path.join(path, '')
+        with self.lock:
+            for item in tuple(self.items):
+                if item.startswith(prefix):
+                    del self.items[item]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.items.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,115 @@
+import re
+
+# non-secret fields stored in the index
+META_FIELDS = ('username', 'URL', 'title')
+# `key: value`, but not a URL on a line of its own
+FIELD_RE = re.compile(r'([^\s:]+):(?!//)\s*(.*)')
+
+
+class Entry:
+    """
+    Decrypted item: a password on the first line, followed by `key: value`
+    fields and notes.
+
+    The text is kept as is and split into fields on the first lookup, so
+    str() gives back the exact text and unused entries cost nothing.
+    """
+
+    __slots__ = ('text', '_lines', '_fields')
+
+    def __init__(self, text: str):
+        self.text = text
+        self._lines = None
+        self._fields = None
+
+    @classmethod
+    def create(cls, password: str, fields=(), notes: str = '') -> 'Entry':
+        """
+        Build an entry from a password, (key, value) pairs or a dict of
+        fields and free text notes. Fields without a value are left out,
+        and the text ends with a newline as items written by pass do.
+        """
+        if isinstance(fields, dict):
+            fields = fields.items()
+        lines = [password]
+        lines.extend(f'{key}: {value}' for key, value in fields if value)
+        if notes:
+            lines.append(notes.rstrip('\n'))
+        return cls(''.join(f'{line}\n' for line in lines))
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return f'<Entry {list(self.fields)}>'
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Entry):
+            return self.text == other.text
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.text)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._parse()
+
+    def __getitem__(self, key: str) -> str:
+        return self._parse()[key][0][1]
+
+    @property
+    def lines(self) -> list[str]:
+        if self._lines is None:
+            self._lines = self.text.split('\n')
+        return self._lines
+
+    @property
+    def password(self) -> str:
+        return self.lines[0]
+
+    @property
+    def fields(self):
+        """
+        Keys of the fields in order of appearance.
+        """
+        return self._parse().keys()
+
+    def _parse(self) -> dict:
+        # keys to (line number, value) pairs
+        if self._fields is None:
+            self._fields = {}
+            for i, line in enumerate(self.lines[1:], 1):
+                if m := FIELD_RE.fullmatch(line):
+                    self._fields.setdefault(m.group(1), []).append((i, m.group(2).strip()))
+        return self._fields
+
+    def get(self, key: str, default: str | None = None) -> str | None:
+        """
+        Get the value of the first field with the key.
+        """
+        if values := self._parse().get(key):
+            return values[0][1]
+        return default
+
+    def get_all(self, key: str) -> list[str]:
+        return [value for i, value in self._parse().get(key, ())]
+
+    def notes(self, exclude=()) -> str:
+        """
+        Get the lines after the password, except fields with the excluded
+        keys, each ending with a newline.
+        """
+        fields = self._parse()
+        skipped = {i for key in exclude for i, value in fields.get(key, ())}
+        return ''.join(
+            f'{line}\n' for i, line in enumerate(self.lines[1:], 1) if i not in skipped
+        )
+
+    def meta(self) -> dict:
+        """
+        Get non-secret fields of the entry, and whether it has a TOTP field.
+        """
+        meta = {key: self.get(key) for key in META_FIELDS if key in self}
+        if 'TOTP' in self:
+            meta['TOTP'] = True
+        return meta
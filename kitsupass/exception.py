@@ -28,3 +28,19 @@ class NotFoundStorageError(StorageError):
 
 class OverwriteStorageError(StorageError):
     msg = 'Error: item is already exists.'
+
+
+class UnsafeAgentError(StorageError):
+    msg = 'Error: the agent socket is not private to the user.'
+
+
+class RunningAgentError(StorageError):
+    msg = 'Error: the agent is already running.'
+
+
+class KeyringError(StorageError):
+    msg = 'Error: the keyring is not available.'
+
+
+class InvalidKeyringError(StorageError):
+    msg = 'Error: unknown keyring, check KITSUPASS_KEYRING and KITSUPASS_KEYCTL_KEYRING.'
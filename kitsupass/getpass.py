@@ -36,4 +36,5 @@ def getpass(title: str, subtitle: str | None = None) -> str | None:
 
 if __name__ == '__main__':
     title = sys.argv[1] if len(sys.argv) >= 2 else ''
-    print(getpass(title))
+    subtitle = sys.argv[2] if len(sys.argv) >= 3 else None
+    print(getpass(title, subtitle) or '')
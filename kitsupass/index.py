@@ -0,0 +1,343 @@
+import json
+import os
+
+from .entry import Entry
+from .openssl import decrypt, decrypt_v2, derive_key, encrypt_v2, get_version
+
+CACHE_PATH = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'kitsupass')
+INDEX_VERSION = 1
+# as many as for an item of a v1 vault
+INDEX_KEY_ITERATIONS = 10000
+
+
+class Index:
+    """
+    Encrypted map of item paths to their non-secret fields.
+
+    The index is stored in the user cache folder and is refreshed on load by
+    comparing modification times of the storage folders, so only folders
+    changed by other programs are rescanned.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.path = os.path.join(CACHE_PATH, f'{storage.id}.index')
+        self.entries = {}
+        self.folders = {}
+        # folder paths to the names of their subfolders and items
+        self.tree = {'': (set(), set())}
+        # names searched for to usernames and the items which had them
+        self.logins = {}
+        # folders changed since the last refresh reported by a watcher,
+        # or None to compare modification times of every folder
+        self.changed = None
+        self.watched = False
+        self.key = None
+
+    def get_key(self) -> bytes:
+        """
+        Get the key of the index, which is the vault key of a v2 vault, or
+        a key derived once like the key of a v1 item, so the index is saved
+        without deriving a key on every change.
+        """
+        if self.key is None:
+            if self.storage.version == 2:
+                self.key = self.storage.key
+            else:
+                self.key = derive_key(
+                    self.storage.password, self.storage.id.bytes + b'index', INDEX_KEY_ITERATIONS)
+        return self.key
+
+    def _read(self) -> str:
+        with open(self.path, 'r') as f:
+            data = f.read()
+        if get_version(data) == 2:
+            return decrypt_v2(data, self.get_key())
+        # saved by a previous version
+        return decrypt(data, self.storage.password)
+
+    def load(self) -> None:
+        try:
+            data = json.loads(self._read())
+            if data['version'] != INDEX_VERSION:
+                raise ValueError
+        except (OSError, ValueError, KeyError, TypeError):
+            self.rebuild()
+            return
+
+        self.entries = data['entries']
+        self.folders = data['folders']
+        self.logins = data.get('logins', {})
+        self._build_tree()
+        self.refresh()
+
+    def save(self) -> None:
+        os.makedirs(CACHE_PATH, mode=0o700, exist_ok=True)
+        self.storage._atomic_write(self.path, encrypt_v2(json.dumps({
+            'version': INDEX_VERSION,
+            'entries': self.entries,
+            'folders': self.folders,
+            'logins': self.logins,
+        }), self.get_key()))
+
+    def rebuild(self) -> None:
+        self.entries = {}
+        self.folders = {}
+        self._build_tree()
+        self._scan('')
+        self.save()
+
+    def refresh(self) -> bool:
+        """
+        Rescan the folders changed since the last refresh.
+        """
+        if self.changed is not None:
+            return self._refresh_changed()
+
+        changed = False
+        for folder, mtime in tuple(self.folders.items()):
+            if folder not in self.folders:
+                continue  # removed by a rescan of the parent folder
+            try:
+                stat = os.stat(os.path.join(self.storage.path, folder))
+            except FileNotFoundError:
+                self._forget(folder)
+                changed = True
+                continue
+            if stat.st_mtime_ns != mtime:
+                changed |= self._scan(folder, recursive=False)
+            else:
+                changed |= self._check_items(folder)
+
+        if self.watched:
+            self.changed = set()
+        if changed:
+            self.save()
+        return changed
+
+    def watch(self) -> None:
+        """
+        Rescan only the folders passed to invalidate() by a watcher on refresh.
+        """
+        self.watched = True
+        self.changed = set()
+
+    def invalidate(self, folder: str | None = None) -> None:
+        """
+        Mark a folder as changed, or every folder if it's None.
+        """
+        if folder is None:
+            self.changed = None
+        elif self.changed is not None:
+            self.changed.add(folder)
+
+    def list(self, folder: str = '') -> tuple[list[str], list[str]]:
+        """
+        Get sorted names of subfolders and items of a folder.
+        """
+        folders, items = self.tree[folder]
+        return sorted(folders), sorted(items)
+
+    def walk(self, folder: str = '', depth: int = 0):
+        """
+        Yield (depth, name, is last, is folder) of the folder tree in the order
+        of `pass ls`.
+        """
+        folders, items = self.list(folder)
+        names = sorted([(name, True) for name in folders] + [(name, False) for name in items])
+        for i, (name, is_dir) in enumerate(names):
+            yield depth, name, i == len(names) - 1, is_dir
+            if is_dir:
+                yield from self.walk(os.path.join(folder, name), depth + 1)
+
+    def meta(self, path: str) -> dict:
+        return self.entries[path]
+
+    def login(self, name: str, username: str) -> str | None:
+        return self.logins.get(name, {}).get(username)
+
+    def set_login(self, name: str, username: str, path: str) -> None:
+        self.logins.setdefault(name, {})[username] = path
+        self.save()
+
+    def update(self, path: str, text: str) -> None:
+        self._index(path, text)
+        self._touch(os.path.dirname(path))
+        self.save()
+
+    def update_many(self, items) -> None:
+        folders = set()
+        for path, text in items:
+            self._index(path, text)
+            folders.add(os.path.dirname(path))
+        for folder in folders:
+            self._touch(folder)
+        self.save()
+
+    def rescan(self, folder: str) -> None:
+        """
+        Rescan a folder known to have items added by other programs.
+        """
+        self._scan(folder, recursive=False)
+        self.save()
+
+    def remove(self, path: str) -> None:
+        self._remove(path)
+        self._touch(os.path.dirname(path))
+        self.save()
+
+    def move(self, path: str, new_path: str) -> None:
+        if path in self.folders:
+            self._move_folder(path, new_path)
+        elif (meta := self._remove(path)) is not None:
+            self._add(new_path, meta | {'mtime': self._mtime(new_path)})
+        else:
+            # the parent folders are rescanned on refresh
+            return
+        self._touch(os.path.dirname(path))
+        self._touch(os.path.dirname(new_path))
+        self.save()
+
+    def _move_folder(self, path: str, new_path: str) -> None:
+        # items keep their modification times when their folder is renamed,
+        # so they are moved to the new paths without decrypting them again
+        prefix = os.path.join(path, '')
+
+        def rename(item: str) -> str:
+            if item == path or item.startswith(prefix):
+                return new_path + item[len(path):]
+            return item
+
+        self.entries = {rename(item): meta for item, meta in self.entries.items()}
+        self.folders = {rename(folder): mtime for folder, mtime in self.folders.items()}
+        self._build_tree()
+
+    def copy(self, path: str, new_path: str) -> None:
+        meta = self.entries.get(path)
+        if meta is not None:
+            self._add(new_path, meta | {'mtime': self._mtime(new_path)})
+        self._touch(os.path.dirname(new_path))
+        self.save()
+
+    def _mtime(self, path: str) -> int:
+        return os.stat(os.path.join(self.storage.path, path)).st_mtime_ns
+
+    def _touch(self, folder: str) -> None:
+        if folder in self.folders:
+            self.folders[folder] = self._mtime(folder)
+
+    def _index(self, path: str, text: str | None = None) -> None:
+        mtime = self._mtime(path)
+        if text is None:
+            try:
+                text = self.storage._read(os.path.join(self.storage.path, path)) or ''
+            except ValueError:
+                text = ''
+        self._add(path, {'mtime': mtime} | Entry(text).meta())
+
+    def _node(self, folder: str) -> tuple[set, set]:
+        if folder not in self.tree:
+            self.tree[folder] = (set(), set())
+            self._node(os.path.dirname(folder))[0].add(os.path.basename(folder))
+        return self.tree[folder]
+
+    def _build_tree(self) -> None:
+        self.tree = {'': (set(), set())}
+        for folder in self.folders:
+            self._node(folder)
+        for path in self.entries:
+            self._node(os.path.dirname(path))[1].add(os.path.basename(path))
+
+    def _add(self, path: str, meta: dict) -> None:
+        self.entries[path] = meta
+        self._node(os.path.dirname(path))[1].add(os.path.basename(path))
+
+    def _remove(self, path: str) -> dict | None:
+        if (folder := self.tree.get(os.path.dirname(path))) is not None:
+            folder[1].discard(os.path.basename(path))
+        return self.entries.pop(path, None)
+
+    def _forget(self, folder: str) -> None:
+        prefix = os.path.join(folder, '')
+        for path in tuple(self.folders):
+            if path == folder or path.startswith(prefix):
+                del self.folders[path]
+        for path in tuple(self.entries):
+            if os.path.dirname(path) == folder or path.startswith(prefix):
+                del self.entries[path]
+        for path in tuple(self.tree):
+            if path == folder or path.startswith(prefix):
+                del self.tree[path]
+        if folder:
+            self.tree[os.path.dirname(folder)][0].discard(os.path.basename(folder))
+
+    def _check_items(self, folder: str) -> bool:
+        # items edited in place, e.g. by pass edit or git checkout, don't
+        # change the modification time of their folder
+        changed = False
+        for name in tuple(self.tree.get(folder, ((), ()))[1]):
+            path = os.path.join(folder, name)
+            try:
+                mtime = self._mtime(path)
+            except FileNotFoundError:
+                self._remove(path)
+                changed = True
+                continue
+            if mtime != self.entries[path]['mtime']:
+                self._index(path)
+                changed = True
+        return changed
+
+    def _refresh_changed(self) -> bool:
+        changed = False
+        folders, self.changed = self.changed, set()
+        for folder in sorted(folders):
+            if not os.path.isdir(os.path.join(self.storage.path, folder)):
+                if folder in self.folders:
+                    self._forget(folder)
+                    changed = True
+                continue
+            # a new folder is scanned along with the closest known parent
+            while folder not in self.folders:
+                folder = os.path.dirname(folder)
+            changed |= self._scan(folder, recursive=False)
+
+        if changed:
+            self.save()
+        return changed
+
+    def _scan(self, folder: str, recursive: bool = True) -> bool:
+        changed = False
+        self.folders[folder] = self._mtime(folder)
+        folders, items = self._node(folder)
+
+        paths = set()
+        for item in os.scandir(os.path.join(self.storage.path, folder)):
+            if item.name.startswith('.'):
+                continue
+
+            path = os.path.join(folder, item.name)
+            if item.is_dir():
+                if recursive or path not in self.folders:
+                    changed |= self._scan(path)
+                continue
+
+            paths.add(path)
+            meta = self.entries.get(path)
+            if not meta or meta['mtime'] != item.stat().st_mtime_ns:
+                self._index(path)
+                changed = True
+
+        for name in tuple(items):
+            path = os.path.join(folder, name)
+            if path not in paths:
+                self._remove(path)
+                changed = True
+
+        for name in tuple(folders):
+            path = os.path.join(folder, name)
+            if not os.path.isdir(os.path.join(self.storage.path, path)):
+                self._forget(path)
+                changed = True
+
+        return changed
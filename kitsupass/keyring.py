@@ -1,3 +1,9 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import tempfile
+import threading
 import uuid
 
 try:
@@ -5,47 +11,323 @@ try:
 except ImportError:
     secretstorage = None
 
+from . import exception
+from .agent import check_folder
+from .openssl import decrypt_v2, encrypt_v2
 
-def save_password(id: uuid.UUID, password: str) -> None:
-    if not secretstorage:
-        return
+KEYRING_BACKEND = os.getenv('KITSUPASS_KEYRING', 'secretservice')
+# lifetime of passwords in the kernel keyring in seconds, 0 to keep them
+KEYCTL_TIMEOUT = int(os.getenv('KITSUPASS_KEYCTL_TIMEOUT', 15 * 60))
+KEYCTL_KEYRING = os.getenv('KITSUPASS_KEYCTL_KEYRING', 'user')
+KEYRING_PATH = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'kitsupass')
 
-    dbus_connection = secretstorage.dbus_init()
-    collection = secretstorage.get_default_collection(dbus_connection)
-    if collection.is_locked():
-        collection.unlock()
-    collection.create_item(f'kitsupass://{id}', {
-        'application': 'kitsupass',
-        'username': str(id),
-        'URL': f'kitsupass://{id}',
-    }, password)
-    dbus_connection.close()
+KEYRINGS = {}
+KEYRING = None
 
 
-def remove_password(id: uuid.UUID) -> None:
-    if not secretstorage:
-        return
+def backend(name: str):
+    def decorator(cls):
+        cls.name = name
+        KEYRINGS[name] = cls
+        return cls
+    return decorator
+
+
+@backend('none')
+class Keyring:
+    """
+    Keyring which doesn't remember passwords, the base of other backends.
+    """
+
+    def load_password(self, id: uuid.UUID) -> str | None:
+        return None
+
+    def save_password(self, id: uuid.UUID, password: str) -> None:
+        pass
+
+    def remove_password(self, id: uuid.UUID) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+@backend('secretservice')
+class SecretServiceKeyring(Keyring):
+    """
+    Secret Service keyring, e.g. GNOME Keyring or KWallet.
+
+    The D-Bus connection, the unlocked default collection and the items
+    found by the vault id are kept between calls, so a long-running process
+    such as the agent or the browser API pays for them once and a single
+    lookup is made per vault.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.collection = None
+        self.items = {}
+        self.lock = threading.RLock()
+
+    def get_collection(self):
+        if self.collection is None:
+            self.connection = secretstorage.dbus_init()
+            self.collection = secretstorage.get_default_collection(self.connection)
+        if self.collection.is_locked():
+            self.collection.unlock()
+        return self.collection
+
+    def get_item(self, id: uuid.UUID):
+        # misses are not cached, the password may be saved by another process
+        if id not in self.items:
+            for item in self.get_collection().search_items({'URL': f'kitsupass://{id}'}):
+                self.items[id] = item
+                break
+        return self.items.get(id)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            self.collection = None
+            self.items.clear()
+
+    def call(self, f, *args):
+        """
+        Call a method, reconnecting once if the connection or a cached item
+        went stale, e.g. the keyring daemon was restarted.
+        """
+        if not secretstorage:
+            return
+
+        with self.lock:
+            try:
+                return f(*args)
+            except (secretstorage.SecretStorageException, OSError):
+                self.close()
+            try:
+                return f(*args)
+            except (secretstorage.SecretStorageException, OSError) as e:
+                raise exception.KeyringError from e
+
+    def save_password(self, id: uuid.UUID, password: str) -> None:
+        self.call(self._save_password, id, password)
+
+    def remove_password(self, id: uuid.UUID) -> None:
+        self.call(self._remove_password, id)
+
+    def load_password(self, id: uuid.UUID) -> str | None:
+        return self.call(self._load_password, id)
+
+    def _save_password(self, id: uuid.UUID, password: str) -> None:
+        self.items[id] = self.get_collection().create_item(f'kitsupass://{id}', {
+            'application': 'kitsupass',
+            'username': str(id),
+            'URL': f'kitsupass://{id}',
+        }, password, replace=True)
+
+    def _remove_password(self, id: uuid.UUID) -> None:
+        self.items.pop(id, None)
+        for item in self.get_collection().search_items({'URL': f'kitsupass://{id}'}):
+            item.delete()
+
+    def _load_password(self, id: uuid.UUID) -> str | None:
+        if item := self.get_item(id):
+            return item.get_secret().decode()
+
+
+@backend('keyctl')
+class KernelKeyring(Keyring):
+    """
+    Linux kernel keyring, accessed through libkeyutils.
+
+    A lookup is a couple of system calls, which makes it the fastest backend
+    for SSH sessions and headless servers without D-Bus. Passwords expire
+    after KITSUPASS_KEYCTL_TIMEOUT seconds. The user keyring is shared by
+    all sessions of the user, the session keyring by the login session only.
+    """
+
+    KEY_SPEC = {'session': -3, 'user': -4}
+    # errors of missing, expired and revoked keys
+    MISSING = (errno.ENOKEY, errno.EKEYEXPIRED, errno.EKEYREVOKED)
+
+    def __init__(self, keyring: str = KEYCTL_KEYRING, timeout: int = KEYCTL_TIMEOUT):
+        if keyring not in self.KEY_SPEC:
+            raise exception.InvalidKeyringError
+        self.keyring = self.KEY_SPEC[keyring]
+        self.timeout = timeout
+        self.lib = None
+        if path := ctypes.util.find_library('keyutils'):
+            self.lib = ctypes.CDLL(path, use_errno=True)
+            self.lib.add_key.argtypes = [
+                ctypes.c_char_p, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int32]
+            self.lib.add_key.restype = ctypes.c_int32
+            self.lib.keyctl_search.argtypes = [
+                ctypes.c_int32, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int32]
+            self.lib.keyctl_search.restype = ctypes.c_long
+            self.lib.keyctl_read_alloc.argtypes = [ctypes.c_int32, ctypes.POINTER(ctypes.c_void_p)]
+            self.lib.keyctl_read_alloc.restype = ctypes.c_long
+            self.lib.keyctl_set_timeout.argtypes = [ctypes.c_int32, ctypes.c_uint]
+            self.lib.keyctl_set_timeout.restype = ctypes.c_long
+            self.lib.keyctl_unlink.argtypes = [ctypes.c_int32, ctypes.c_int32]
+            self.lib.keyctl_unlink.restype = ctypes.c_long
+            self.libc = ctypes.CDLL(None)
+            self.libc.free.argtypes = [ctypes.c_void_p]
 
-    dbus_connection = secretstorage.dbus_init()
-    collection = secretstorage.get_default_collection(dbus_connection)
-    if collection.is_locked():
-        collection.unlock()
-    for item in collection.search_items({'URL': f'kitsupass://{id}'}):
-        password = item.delete()
-    dbus_connection.close()
+    def check(self, result: int) -> int | None:
+        if result >= 0:
+            return result
+        code = ctypes.get_errno()
+        if code in self.MISSING:
+            return None
+        # e.g. EACCES from a keyring of another user, or EDQUOT
+        raise exception.KeyringError from OSError(code, os.strerror(code))
+
+    def search(self, id: uuid.UUID) -> int | None:
+        return self.check(self.lib.keyctl_search(
+            self.keyring, b'user', f'kitsupass:{id}'.encode(), 0))
+
+    def save_password(self, id: uuid.UUID, password: str) -> None:
+        if not self.lib:
+            return
+
+        data = password.encode()
+        key = self.check(self.lib.add_key(
+            b'user', f'kitsupass:{id}'.encode(), data, len(data), self.keyring))
+        if key is not None and self.timeout:
+            self.check(self.lib.keyctl_set_timeout(key, self.timeout))
+
+    def remove_password(self, id: uuid.UUID) -> None:
+        if not self.lib:
+            return
+
+        if (key := self.search(id)) is not None:
+            self.check(self.lib.keyctl_unlink(key, self.keyring))
+
+    def load_password(self, id: uuid.UUID) -> str | None:
+        if not self.lib:
+            return
+
+        key = self.search(id)
+        if key is None:
+            return
+
+        buffer = ctypes.c_void_p()
+        size = self.check(self.lib.keyctl_read_alloc(key, ctypes.byref(buffer)))
+        if size is None:
+            return
+        try:
+            return ctypes.string_at(buffer, size).decode()
+        finally:
+            self.libc.free(buffer)
+
+
+@backend('file')
+class FileKeyring(Keyring):
+    """
+    Passwords encrypted in the user cache folder.
+
+    The key is kept in the runtime folder of the user, which is usually
+    a tmpfs cleared on logout, so saved passwords can't be read after it.
+    Without one it is kept in a folder of the temporary folder, which has to
+    be private to the user as the agent socket folder.
+    """
+
+    def __init__(self, path: str = KEYRING_PATH, key_path: str | None = None):
+        self.path = path
+        runtime_path = os.getenv('XDG_RUNTIME_DIR')
+        if runtime_path:
+            runtime_path = os.path.join(runtime_path, 'kitsupass')
+        else:
+            runtime_path = os.path.join(os.getenv('TMPDIR', '/tmp'), f'kitsupass-{os.getuid()}')
+        self.key_path = key_path or os.path.join(runtime_path, 'keyring.key')
+
+    def get_path(self, id: uuid.UUID) -> str:
+        return os.path.join(self.path, f'{id}.keyring')
+
+    def get_key(self, create: bool = False) -> bytes | None:
+        folder = os.path.dirname(self.key_path)
+        if create:
+            os.makedirs(folder, mode=0o700, exist_ok=True)
+        try:
+            check_folder(folder, exception.KeyringError)
+            with open(self.key_path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            if not create:
+                return
+        key = os.urandom(32)
+        self.write(self.key_path, key)
+        return key
+
+    def write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def save_password(self, id: uuid.UUID, password: str) -> None:
+        self.write(self.get_path(id), encrypt_v2(password, self.get_key(create=True)).encode())
+
+    def remove_password(self, id: uuid.UUID) -> None:
+        try:
+            os.remove(self.get_path(id))
+        except FileNotFoundError:
+            pass
+
+    def load_password(self, id: uuid.UUID) -> str | None:
+        key = self.get_key()
+        if not key:
+            return
+        try:
+            with open(self.get_path(id), 'r') as f:
+                return decrypt_v2(f.read(), key)
+        except (OSError, ValueError):
+            return
+
+
+def get_keyring() -> Keyring:
+    """
+    Get the keyring backend selected by KITSUPASS_KEYRING.
+    """
+    global KEYRING
+    if KEYRING is None:
+        if KEYRING_BACKEND not in KEYRINGS:
+            raise exception.InvalidKeyringError
+        KEYRING = KEYRINGS[KEYRING_BACKEND]()
+    return KEYRING
+
+
+def fall_back() -> None:
+    # the keyring only saves asking for the password again, so a process
+    # goes on without it when it fails
+    global KEYRING
+    KEYRING.close()
+    KEYRING = Keyring()
+
+
+def save_password(id: uuid.UUID, password: str) -> None:
+    keyring = get_keyring()
+    try:
+        keyring.save_password(id, password)
+    except exception.KeyringError:
+        fall_back()
+
+
+def remove_password(id: uuid.UUID) -> None:
+    # a password which can't be forgotten is an error, not a fallback
+    get_keyring().remove_password(id)
 
 
 def load_password(id: uuid.UUID) -> str | None:
-    if not secretstorage:
-        return
-
-    password = None
-    dbus_connection = secretstorage.dbus_init()
-    collection = secretstorage.get_default_collection(dbus_connection)
-    if collection.is_locked():
-        collection.unlock()
-    for item in collection.search_items({'URL': f'kitsupass://{id}'}):
-        password = item.get_secret().decode()
-        break
-    dbus_connection.close()
-    return password
+    keyring = get_keyring()
+    try:
+        return keyring.load_password(id)
+    except exception.KeyringError:
+        fall_back()
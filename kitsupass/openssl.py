@@ -1,12 +1,40 @@
 import base64
 import os
 
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives.padding import PKCS7
 
+HEADER_V1 = b'Salted__'
+HEADER_V2 = b'Kitsu_v2'
+KEY_ITERATIONS = 100000
+
+
+def wrap(data: str) -> str:
+    i = 0
+    multiline = ''
+    while True:
+        chunk = data[i:i + 64]
+        if chunk:
+            multiline += chunk + '\n'
+        else:
+            break
+        i += 64
+    return multiline
+
+
+def get_version(data: str) -> int | None:
+    header = base64.b64decode(data[:12])[:8]
+    if header == HEADER_V1:
+        return 1
+    if header == HEADER_V2:
+        return 2
+
 
 def encrypt(text: str, password: str) -> str:
     """
@@ -32,17 +60,7 @@ def encrypt(text: str, password: str) -> str:
     raw = padder.update(text.encode()) + padder.finalize()
     raw = encryptor.update(raw) + encryptor.finalize()
 
-    data = base64.b64encode(b'Salted__' + salt + raw).decode()
-    i = 0
-    multiline = ''
-    while True:
-        chunk = data[i:i + 64]
-        if chunk:
-            multiline += chunk + '\n'
-        else:
-            break
-        i += 64
-    return multiline
+    return wrap(base64.b64encode(HEADER_V1 + salt + raw).decode())
 
 
 def decrypt(data: str, password: str) -> str:
@@ -50,7 +68,7 @@ def decrypt(data: str, password: str) -> str:
     openssl aes-256-cbc -d -pbkdf2 -md sha256 -iter 10000 -a -in data
     """
     raw = base64.b64decode(data)
-    if raw[:8] != b'Salted__':
+    if raw[:8] != HEADER_V1:
         return
 
     salt = raw[8:16]
@@ -73,3 +91,50 @@ def decrypt(data: str, password: str) -> str:
     text = decryptor.update(raw[16:]) + decryptor.finalize()
     text = unpadder.update(text) + unpadder.finalize()
     return text.decode()
+
+
+def derive_key(password: str, salt: bytes, iterations: int = KEY_ITERATIONS) -> bytes:
+    """
+    Derive a vault key which is used to encrypt every item of the vault.
+    """
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=256 // 8,
+        salt=salt,
+        iterations=iterations,
+    )
+    return kdf.derive(password.encode())
+
+
+def derive_subkey(key: bytes, salt: bytes) -> bytes:
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=256 // 8,
+        salt=salt,
+        info=b'kitsupass item',
+    )
+    return hkdf.derive(key)
+
+
+def encrypt_v2(text: str, key: bytes) -> str:
+    """
+    AES-256-GCM with an HKDF-SHA256 subkey of the vault key per item.
+    """
+    salt = os.urandom(16)
+    nonce = os.urandom(12)
+    raw = AESGCM(derive_subkey(key, salt)).encrypt(nonce, text.encode(), HEADER_V2)
+    return wrap(base64.b64encode(HEADER_V2 + salt + nonce + raw).decode())
+
+
+def decrypt_v2(data: str, key: bytes) -> str:
+    raw = base64.b64decode(data)
+    if raw[:8] != HEADER_V2:
+        return
+
+    salt = raw[8:24]
+    nonce = raw[24:36]
+    try:
+        text = AESGCM(derive_subkey(key, salt)).decrypt(nonce, raw[36:], HEADER_V2)
+    except InvalidTag:
+        raise ValueError('Invalid key')
+    return text.decode()
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pyotp
+
+
+class Registry:
+    """
+    Parsed TOTP secrets of the items with a TOTP field.
+
+    The items are found by the TOTP flag of the index, not by name, and
+    each of them is decrypted once while the storage is open, or again
+    after it has been changed.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        # names to (modification time, TOTP field, URL field, TOTP)
+        self.items = {}
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def refresh(self) -> None:
+        # the storage lock is held only to read the index, items are
+        # decrypted without it, so decryption workers and other callers
+        # are not blocked
+        with self.storage.lock:
+            generation = self.storage.generation
+            if generation == self.generation:
+                return
+            mtimes = {
+                name: meta['mtime']
+                for name, meta in self.storage.index.entries.items()
+                if meta.get('TOTP')
+            }
+
+        with self.lock:
+            names = [
+                name for name in sorted(mtimes)
+                if name not in self.items or self.items[name][0] != mtimes[name]
+            ]
+
+        items = {}
+        for name, entry in self.storage.iter_entries(names):
+            uri = entry.get('TOTP')
+            url = entry.get('URL')
+            try:
+                otp = pyotp.parse_uri(uri)
+                if not isinstance(otp, pyotp.TOTP):
+                    continue
+                # a secret which isn't base32 fails when a code is made,
+                # with a binascii.Error, which is a ValueError
+                otp.now()
+            except (TypeError, ValueError):
+                continue
+            items[name] = (mtimes[name], uri, url, otp)
+
+        with self.lock:
+            # a concurrent refresh of a later change has already won
+            if self.generation is not None and generation < self.generation:
+                return
+            self.items = {
+                name: item for name, item in (self.items | items).items()
+                if mtimes.get(name) == item[0]
+            }
+            self.generation = generation
+
+    def fields(self, names=None) -> list[dict]:
+        """
+        Get the TOTP and URL fields of every item, or of the given items.
+        """
+        self.refresh()
+        with self.lock:
+            items = self.items
+        if names is None:
+            names = sorted(items)
+        return [
+            {'name': name, 'TOTP': items[name][1], 'URL': items[name][2]}
+            for name in names if name in items
+        ]
+
+    def codes(self, names=None, now: float | None = None) -> list[dict]:
+        """
+        Get current codes of every item, or of the given items, and the
+        number of seconds they remain valid.
+        """
+        self.refresh()
+        now = time.time() if now is None else now
+        with self.lock:
+            items = self.items
+        if names is None:
+            names = sorted(items)
+
+        codes = []
+        for name in names:
+            if name not in items:
+                continue
+            mtime, uri, url, otp = items[name]
+            codes.append({
+                'name': name,
+                'code': otp.at(now),
+                'remaining': otp.interval - now % otp.interval,
+                'TOTP': uri,
+                'URL': url,
+            })
+        return codes
@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+import urllib.parse
+
+PROMPT = os.getenv('KITSUPASS_PROMPT', 'auto')
+PINENTRY = os.getenv('KITSUPASS_PINENTRY', 'pinentry')
+
+PROMPTS = {}
+
+
+def prompt(name: str):
+    def decorator(f):
+        PROMPTS[name] = f
+        return f
+    return decorator
+
+
+@prompt('terminal')
+def ask_terminal(title: str, subtitle: str | None = None) -> str | None:
+    from getpass import getpass
+
+    return getpass(f'{title}: ') or None
+
+
+@prompt('gtk')
+def ask_gtk(title: str, subtitle: str | None = None) -> str | None:
+    """
+    Show a dialog in the running process, which is fast when GTK is already
+    imported, e.g. by askpass.
+    """
+    from .getpass import getpass
+
+    return getpass(title, subtitle) or None
+
+
+@prompt('helper')
+def ask_helper(title: str, subtitle: str | None = None) -> str | None:
+    """
+    Show a dialog in a helper process of the running interpreter, which keeps
+    GTK out of processes which don't use it.
+    """
+    args = [sys.executable, '-m', 'kitsupass.getpass', title]
+    if subtitle:
+        args.append(subtitle)
+    return subprocess.check_output(args).decode().strip('\n').strip() or None
+
+
+def escape(text: str) -> str:
+    return text.replace('%', '%25').replace('\r', '%0D').replace('\n', '%0A')
+
+
+@prompt('pinentry')
+def ask_pinentry(title: str, subtitle: str | None = None) -> str | None:
+    """
+    Ask a pin entry program, such as pinentry-gnome3 or pinentry-curses,
+    through the Assuan protocol.
+    """
+    try:
+        process = subprocess.Popen(
+            [PINENTRY], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    except OSError:
+        return None
+
+    def command(line: str | None = None) -> str | None:
+        if line:
+            process.stdin.write(f'{line}\n')
+            process.stdin.flush()
+
+        data = None
+        for response in process.stdout:
+            response = response.rstrip('\n')
+            if response.startswith('D '):
+                data = urllib.parse.unquote(response[2:])
+            elif response == 'OK' or response.startswith('OK '):
+                return data
+            elif response.startswith('ERR'):
+                raise ValueError(response)
+        raise ValueError('pinentry exited')
+
+    try:
+        command()
+        command(f'SETTITLE {escape("kitsupass")}')
+        command(f'SETDESC {escape(subtitle or title)}')
+        command(f'SETPROMPT {escape(title)}:')
+        return command('GETPIN') or None
+    except (OSError, ValueError):
+        return None
+    finally:
+        try:
+            process.stdin.write('BYE\n')
+            process.stdin.close()
+        except OSError:
+            pass
+        process.wait()
+
+
+def get_prompts(has_terminal: bool = False, has_gui: bool = False) -> list:
+    """
+    Get prompts to ask in order, KITSUPASS_PROMPT selects a single prompt.
+    """
+    if PROMPT != 'auto':
+        return [PROMPTS[PROMPT]]
+
+    prompts = []
+    if has_terminal:
+        prompts.append(ask_terminal)
+    if has_gui:
+        if 'gi.repository.Gtk' in sys.modules:
+            prompts.append(ask_gtk)
+        else:
+            prompts.append(ask_helper)
+    return prompts
+
+
+def ask_password(title: str, has_terminal: bool = False, has_gui: bool = False) -> str | None:
+    for ask in get_prompts(has_terminal, has_gui):
+        if password := ask(title):
+            return password
@@ -0,0 +1,244 @@
+import bisect
+import collections
+import fnmatch
+import heapq
+import re
+
+MODES = ('substring', 'glob', 'regex')
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton, which finds whether a text contains any of the
+    patterns in a single pass over the text.
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [False]
+
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(False)
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] = True
+
+        # fail links of a state point to the longest suffix of its prefix,
+        # which is a prefix of some pattern, so they are set breadth first
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def match(self, text: str) -> bool:
+        if self.output[0]:
+            return True
+
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
+
+
+def get_matcher(patterns, mode: str = 'substring', ignore_case: bool = False):
+    """
+    Get a function checking whether a name matches any of the patterns,
+    which are substrings, shell-style wildcards of the whole name or
+    regular expressions.
+    """
+    patterns = tuple(patterns)
+    if mode not in MODES:
+        raise ValueError(mode)
+    if not patterns:
+        return lambda name: False
+
+    if mode == 'substring':
+        if ignore_case:
+            patterns = tuple(pattern.casefold() for pattern in patterns)
+
+        if len(patterns) == 1:
+            # a single substring is found faster by str.__contains__
+            pattern = patterns[0]
+            match = lambda name: pattern in name
+        else:
+            match = Automaton(patterns).match
+
+        if ignore_case:
+            return lambda name: match(name.casefold())
+        return match
+
+    if mode == 'glob':
+        patterns = tuple(fnmatch.translate(pattern) for pattern in patterns)
+    try:
+        regex = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in patterns),
+            re.IGNORECASE if ignore_case else 0,
+        )
+    except re.error as e:
+        raise ValueError(str(e))
+    if mode == 'glob':
+        return lambda name: regex.match(name) is not None
+    return lambda name: regex.search(name) is not None
+
+
+SCORE_MATCH = 16
+SCORE_GAP_START = -3
+SCORE_GAP_EXTENSION = -1
+BONUS_BOUNDARY = 8
+BONUS_DELIMITER = 9
+BONUS_CAMEL = 7
+BONUS_CONSECUTIVE = 4
+BONUS_FIRST_CHAR_MULTIPLIER = 2
+DELIMITERS = '/'
+SEPARATORS = ' .,:;_-'
+
+
+def get_bonus(text: str, i: int) -> int:
+    if i == 0:
+        return BONUS_BOUNDARY
+    prev, char = text[i - 1], text[i]
+    if prev in DELIMITERS:
+        return BONUS_DELIMITER
+    if prev in SEPARATORS:
+        return BONUS_BOUNDARY
+    if (prev.islower() and char.isupper()) or (not prev.isdigit() and char.isdigit()):
+        return BONUS_CAMEL
+    return 0
+
+
+def fuzzy_score(pattern: str, text: str, key: str | None = None) -> int | None:
+    """
+    Score a subsequence match of the pattern in the text like fzf does,
+    rewarding consecutive characters and characters at word boundaries and
+    penalizing gaps, or get None if the text doesn't match. The key is the
+    text to search in, e.g. the lowercase text.
+    """
+    key = text if key is None else key
+    if not pattern:
+        return 0
+
+    # the first match from the left, then the shortest match ending there
+    end = -1
+    for char in pattern:
+        end = key.find(char, end + 1)
+        if end < 0:
+            return None
+    start = end + 1
+    for char in reversed(pattern):
+        start = key.rfind(char, 0, start)
+
+    score = 0
+    position = start - 1
+    chunk_bonus = 0
+    for j, char in enumerate(pattern):
+        i = key.find(char, position + 1)
+        bonus = get_bonus(text, i)
+        if i == position + 1 and j:
+            chunk_bonus = max(chunk_bonus, bonus, BONUS_CONSECUTIVE)
+            bonus = chunk_bonus
+        else:
+            if j:
+                score += SCORE_GAP_START + SCORE_GAP_EXTENSION * (i - position - 2)
+            chunk_bonus = bonus
+        if not j:
+            bonus *= BONUS_FIRST_CHAR_MULTIPLIER
+        score += SCORE_MATCH + bonus
+        position = i
+    return score
+
+
+class NameTable:
+    """
+    Names prepared for fuzzy search.
+
+    Names which contain the pattern as a subsequence are found by a regular
+    expression over all names joined by newlines, so only the candidates
+    are scored in Python, and the best of them are selected with a heap.
+    """
+
+    def __init__(self, names):
+        self.names = sorted(names)
+        # characters which lowercase to more than one character, such as İ,
+        # are kept, so positions in keys are positions in names for scoring
+        self.keys = [
+            ''.join(char if len(lower := char.lower()) > 1 else lower for char in name)
+            for name in self.names
+        ]
+        self.text = '\n'.join(self.names)
+        self.lower_text = '\n'.join(self.keys)
+        self.starts = self.get_starts(self.names)
+        self.lower_starts = self.get_starts(self.keys)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def get_starts(names: list[str]) -> list[int]:
+        """
+        Get offsets of the names in the text of the names joined by newlines.
+        """
+        starts = []
+        position = 0
+        for name in names:
+            starts.append(position)
+            position += len(name) + 1
+        return starts
+
+    def candidates(self, pattern: str, keys: list[str]):
+        if keys is self.names:
+            text, starts = self.text, self.starts
+        else:
+            text, starts = self.lower_text, self.lower_starts
+        # [^c\n]*c finds the next c without backtracking, and the literal
+        # first character lets the regular expression engine skip ahead
+        regex = re.compile(re.escape(pattern[0]) + ''.join(
+            f'[^{re.escape(char)}\n]*{re.escape(char)}' for char in pattern[1:]
+        ))
+        position = 0
+        while match := regex.search(text, position):
+            i = bisect.bisect_right(starts, match.start()) - 1
+            yield i
+            # the rest of the line doesn't matter once it matched
+            if i + 1 == len(starts):
+                break
+            position = starts[i + 1]
+
+    def search(self, pattern: str, limit: int = 0) -> list[str]:
+        """
+        Get names matching the pattern, the best first. The pattern is case
+        sensitive only if it contains uppercase characters.
+        """
+        pattern = ''.join(pattern.split())
+        if not pattern:
+            return self.names[:limit] if limit else list(self.names)
+
+        keys = self.names if pattern != pattern.lower() else self.keys
+        scored = (
+            # ties are broken by shorter, then sorted names
+            (fuzzy_score(pattern, self.names[i], keys[i]), -len(self.names[i]), -i)
+            for i in self.candidates(pattern, keys)
+        )
+        if limit:
+            best = heapq.nlargest(limit, scored)
+        else:
+            best = sorted(scored, reverse=True)
+        return [self.names[-index] for score, length, index in best]
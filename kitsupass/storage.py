@@ -1,15 +1,34 @@
+import collections
+import functools
 import os
 import shutil
-import subprocess
+import tempfile
+import threading
 import uuid
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from getpass import getpass
 
 from . import exception
+from .cache import Cache
+from .entry import Entry
+from .index import Index
 from .keyring import save_password, load_password, remove_password
-from .openssl import encrypt, decrypt
+from .openssl import encrypt, decrypt, encrypt_v2, decrypt_v2, derive_key, get_version
+from .prompt import ask_password
+from .search import NameTable, get_matcher
+from .watcher import get_watcher
 
 STORAGE_PATH = os.path.expanduser('~/.local/share/kitsupass')
+WORKERS = max(1, int(os.getenv('KITSUPASS_WORKERS', os.cpu_count() or 1)))
+
+
+def locked(method):
+    @functools.wraps(method)
+    def f(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return f
 
 
 class Storage:
@@ -18,12 +37,80 @@ class Storage:
         self.has_gui = has_gui
         self.path = os.getenv('KITSUPASS_PATH', STORAGE_PATH)
         self.password = None
+        self.key = None
+        # format of the vault id, which the index is encrypted like
+        self.version = None
+        self._index = None
+        self.cache = Cache()
+        self.lock = threading.RLock()
+        # the vault key of v2 items read from a storage opened as v1
+        self.key_lock = threading.Lock()
+        self.watcher = None
+        self._generation = 0
+        # generation and the name table for fuzzy search
+        self._names = None
+        self._otp = None
 
     @property
     def is_open(self) -> bool:
         return bool(self.password)
 
-    def open(self):
+    @property
+    def generation(self) -> int:
+        """
+        Counter increased on every change of the storage, including changes
+        made by other programs.
+        """
+        if self.is_open:
+            with self.lock:
+                if self.index.refresh():
+                    self._generation += 1
+        return self._generation
+
+    @property
+    @locked
+    def index(self) -> Index:
+        if not self.is_open:
+            raise exception.LockedStorageError
+
+        if self._index is None:
+            self._index = Index(self)
+            self._index.load()
+            if self.watcher:
+                self._index.watch()
+        return self._index
+
+    def watch(self) -> None:
+        """
+        Watch the storage folder for changes made by other programs, so long
+        running processes don't check every folder of the index on refresh.
+        """
+        with self.lock:
+            if self.watcher:
+                return
+            self.watcher = get_watcher(self.path)
+            if not self.watcher:
+                return
+            self.watcher.subscribe(self._on_change)
+            if self._index is not None:
+                self._index.refresh()
+                self._index.watch()
+        self.watcher.start()
+
+    def unwatch(self) -> None:
+        with self.lock:
+            watcher, self.watcher = self.watcher, None
+            if self._index is not None:
+                self._index.watched = False
+                self._index.changed = None
+        if watcher:
+            watcher.stop()
+
+    def ask_password(self) -> str | None:
+        return ask_password('Enter the primary vault password', self.has_terminal, self.has_gui)
+
+    @locked
+    def open(self, password: str | None = None):
         for filename in os.listdir(self.path):
             if filename.startswith('.urn:uuid:'):
                 self.id = uuid.UUID(filename.rpartition(':')[-1])
@@ -34,34 +121,50 @@ class Storage:
             raise exception.WrongStorageError
 
         initial_password = load_password(self.id)
-        password = initial_password
-
-        if not password and self.has_terminal:
-            password = getpass('Enter the primary vault password: ')
+        password = password or initial_password
 
-        if not password and self.has_gui:
-            password = subprocess.check_output([
-                'python', '-m', 'kitsupass.getpass',
-                'Enter the primary vault password',
-            ]).decode().strip('\n').strip()
+        if not password:
+            password = self.ask_password()
 
         if not password:
             raise exception.InvalidPasswordStorageError
 
+        key = None
         with open(id_path, 'r') as f:
-            try:
-                if decrypt(f.read(), password or '') != str(self.id):
-                    raise exception.InvalidPasswordStorageError
-            except ValueError:
-                raise exception.InvalidPasswordStorageError
+            data = f.read()
+        version = get_version(data)
+
+        try:
+            if version == 2:
+                key = derive_key(password, self.id.bytes)
+                text = decrypt_v2(data, key)
+            else:
+                text = decrypt(data, password)
+        except ValueError:
+            raise exception.InvalidPasswordStorageError
+
+        if text != str(self.id):
+            raise exception.InvalidPasswordStorageError
 
         if not initial_password:
             save_password(self.id, password)
         self.password = password
+        self.key = key
+        self.version = version
+        # items may have changed while the storage was locked, which the
+        # index finds on load without counting it as a change
+        self._generation += 1
 
+    @locked
     def close(self):
+        self.cache.clear()
         remove_password(self.id)
         self.password = None
+        self.key = None
+        self._index = None
+        self._names = None
+        self._otp = None
+        self._generation += 1
 
     def create(self):
         if os.path.exists(self.path):
@@ -80,20 +183,73 @@ class Storage:
 
         save_password(self.id, self.password)
 
+    @locked
     def insert(self, name: str, data: str) -> None:
         if not self.is_open:
             raise exception.LockedStorageError
 
         orig_path = os.path.join(self.path, name)
         path = orig_path
+        encrypted = self._encrypt(data)
         i = 2
-        while os.path.exists(path):
+        while not self._atomic_create(path, encrypted):
             path = f'{orig_path} ({i})'
             i += 1
 
-        with open(path, 'w') as f:
-            f.write(encrypt(data, self.password))
+        if self._index:
+            self._index.update(os.path.relpath(path, self.path), data)
+        self._generation += 1
+
+    def insert_many(self, items, workers: int | None = None) -> list[str]:
+        """
+        Insert (name, data) pairs, encrypting them on a thread pool. Names
+        are reserved against the index first, and taken again when the files
+        are created, in case an item of the name was inserted meanwhile.
+        Returns the inserted names.
+        """
+        if not self.is_open:
+            raise exception.LockedStorageError
 
+        def candidates(name: str):
+            yield os.path.relpath(os.path.join(self.path, name), self.path)
+            i = 2
+            while True:
+                yield f'{name} ({i})'
+                i += 1
+
+        items = tuple(items)
+        with self.lock:
+            self.index.refresh()
+            taken = set(self.index.entries)
+            names = []
+            for name, data in items:
+                new_name = next(n for n in candidates(name) if n not in taken)
+                taken.add(new_name)
+                names.append(new_name)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers or WORKERS)) as executor:
+            encrypted = tuple(executor.map(self._encrypt, (data for name, data in items)))
+
+        with self.lock:
+            changed = set()
+            for i, ((name, data), new_name) in enumerate(zip(items, names)):
+                path = os.path.join(self.path, new_name)
+                if not self._atomic_create(path, encrypted[i]):
+                    for new_name in candidates(name):
+                        if new_name not in taken and self._atomic_create(
+                                os.path.join(self.path, new_name), encrypted[i]):
+                            break
+                    taken.add(new_name)
+                    names[i] = new_name
+                    changed.add(os.path.dirname(new_name))
+            self.index.update_many(zip(names, (data for name, data in items)))
+            for folder in changed:
+                self.index.rescan(folder)
+            self._generation += 1
+
+        return names
+
+    @locked
     def edit(self, name: str, data: str) -> None:
         if not self.is_open:
             raise exception.LockedStorageError
@@ -102,8 +258,11 @@ class Storage:
         if not os.path.exists(path):
             raise exception.NotFoundStorageError
 
-        with open(path, 'w') as f:
-            f.write(encrypt(data, self.password))
+        self._write(path, data)
+        self.cache.invalidate(path)
+        if self._index:
+            self._index.update(os.path.relpath(path, self.path), data)
+        self._generation += 1
 
     def show(self, name: str = '') -> str:
         if not self.is_open:
@@ -118,19 +277,94 @@ class Storage:
             raise exception.NotFoundStorageError
 
         if os.path.isdir(path):
-            return '\n'.join(self.find(name))
+            return self.tree(name)
 
         else:
-            with open(path, 'r') as f:
-                return decrypt(f.read(), self.password)
+            return str(self.entry(name))
+
+    def entry(self, name: str) -> Entry:
+        """
+        Get a decrypted item, which is cached as an entry, so its fields are
+        parsed once however many times it is shown.
+        """
+        if not self.is_open:
+            raise exception.LockedStorageError
 
+        path = os.path.join(self.path, name)
+        if not os.path.isfile(path):
+            raise exception.NotFoundStorageError
+
+        stat = os.stat(path)
+        entry = self.cache.get(path, stat)
+        if entry is None:
+            entry = Entry(self._read(path))
+            self.cache.put(path, stat, entry)
+        return entry
+
+    def meta(self, name: str) -> dict:
+        """
+        Get non-secret fields of an item from the index without decrypting it.
+        """
+        path = os.path.relpath(os.path.join(self.path, name), self.path)
+        with self.lock:
+            try:
+                return self.index.meta(path)
+            except KeyError:
+                raise exception.NotFoundStorageError
+
+    def iter_entries(self, names, workers: int | None = None):
+        """
+        Decrypt items on a thread pool and yield (name, entry) pairs in the
+        order of names. At most twice as many items as workers are decrypted
+        ahead of the consumer.
+        """
+        if not self.is_open:
+            raise exception.LockedStorageError
+
+        workers = max(1, workers or WORKERS)
+        if workers == 1:
+            for name in names:
+                yield name, self.entry(name)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = collections.deque()
+        try:
+            for name in names:
+                pending.append((name, executor.submit(self.entry, name)))
+                if len(pending) >= workers * 2:
+                    name, future = pending.popleft()
+                    yield name, future.result()
+
+            while pending:
+                name, future = pending.popleft()
+                yield name, future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_decrypted(self, names, workers: int | None = None):
+        for name, entry in self.iter_entries(names, workers):
+            yield name, str(entry)
+
+    def show_many(self, names, workers: int | None = None) -> list[str]:
+        return [text for name, text in self.iter_decrypted(names, workers)]
+
+    def entries(self, names, workers: int | None = None) -> list[Entry]:
+        return [entry for name, entry in self.iter_entries(names, workers)]
+
+    @locked
     def delete(self, name: str) -> str:
         path = os.path.join(self.path, name)
         if not os.path.exists(path):
             raise exception.NotFoundStorageError
 
         os.remove(path)
+        self.cache.invalidate(path)
+        if self._index:
+            self._index.remove(os.path.relpath(path, self.path))
+        self._generation += 1
 
+    @locked
     def move(self, name: str, new_name: str) -> str:
         path = os.path.join(self.path, name)
         if not os.path.exists(path):
@@ -141,7 +375,16 @@ class Storage:
             raise exception.OverwriteStorageError
 
         os.rename(path, new_path)
-
+        self.cache.invalidate(path)
+        self.cache.invalidate(new_path)
+        self.cache.invalidate_folder(path)
+        if self._index:
+            self._index.move(
+                os.path.relpath(path, self.path),
+                os.path.relpath(new_path, self.path))
+        self._generation += 1
+
+    @locked
     def copy(self, name: str, new_name: str) -> str:
         path = os.path.join(self.path, name)
         if not os.path.exists(path):
@@ -149,11 +392,259 @@ class Storage:
 
         new_path = os.path.join(self.path, new_name)
         shutil.copy(path, new_path)
+        if self._index:
+            self._index.copy(
+                os.path.relpath(path, self.path),
+                os.path.relpath(new_path, self.path))
+        self._generation += 1
+
+    def find(self, name: str = ''):
+        """
+        Yield paths of items relative to the storage, which names contain
+        the name.
+        """
+        return self.search((name,))
+
+    def select(self, names) -> list[str]:
+        """
+        Get the names of existing items of the names in their order.
+        """
+        with self.lock:
+            self.index.refresh()
+            entries = self.index.entries
+            return [name for name in dict.fromkeys(names) if name in entries]
+
+    def resolve(self, name: str, username: str, workers: int | None = None) -> str | None:
+        """
+        Get the path of an item which name contains the name and which has
+        the username, e.g. an SSH login to a host.
+
+        Resolved items are remembered by the index, so next time only that
+        item is decrypted to check it. Otherwise the candidates are decrypted
+        on a thread pool, those with the username in the index first, until
+        any of them has the username.
+        """
+        if not self.is_open:
+            raise exception.LockedStorageError
+
+        paths = list(self.find(name))
+        with self.lock:
+            path = self.index.login(name, username)
+            usernames = {item: self.index.entries.get(item, {}).get('username') for item in paths}
+        if path in usernames:
+            try:
+                if username in self.entry(path).get_all('username'):
+                    return path
+            except exception.NotFoundStorageError:
+                pass
+
+        paths.sort(key=lambda item: usernames[item] != username)
+        executor = ThreadPoolExecutor(max_workers=max(1, workers or WORKERS))
+        try:
+            futures = {executor.submit(self.entry, path): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    entry = future.result()
+                except exception.NotFoundStorageError:
+                    continue
+                if username in entry.get_all('username'):
+                    path = futures[future]
+                    with self.lock:
+                        self.index.set_login(name, username, path)
+                    return path
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def search(self, patterns, mode: str = 'substring', ignore_case: bool = False):
+        """
+        Yield paths of items relative to the storage, which names match any
+        of the patterns, as soon as they are found.
+        """
+        match = get_matcher(patterns, mode, ignore_case)
+        if self.is_open:
+            with self.lock:
+                self.index.refresh()
+                paths = sorted(self.index.entries)
+            for path in paths:
+                if match(os.path.basename(path)):
+                    yield path
+            return
+
+        for path, foldernames, filenames in os.walk(self.path):
+            foldernames[:] = sorted(f for f in foldernames if not f.startswith('.'))
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                if match(filename):
+                    yield os.path.relpath(os.path.join(path, filename), self.path)
+
+    def fuzzy(self, pattern: str, limit: int = 0) -> list[str]:
+        """
+        Get paths of items relative to the storage, which fuzzy match the
+        pattern, the best first.
+        """
+        if not self.is_open:
+            # names are read from the storage folder while it's locked
+            return NameTable(self.find()).search(pattern, limit)
+
+        with self.lock:
+            generation = self.generation
+            if self._names is None or self._names[0] != generation:
+                self._names = (generation, NameTable(self.index.entries))
+            names = self._names[1]
+        return names.search(pattern, limit)
+
+    def otp(self, names=None, codes: bool = True) -> list[dict]:
+        """
+        Get current TOTP codes of every item with a TOTP field, or of the
+        given items, or only their TOTP and URL fields.
+        """
+        from .otp import Registry
+
+        if not self.is_open:
+            raise exception.LockedStorageError
+
+        with self.lock:
+            if self._otp is None:
+                self._otp = Registry(self)
+            registry = self._otp
+        if names is not None:
+            names = [os.path.normpath(name) for name in names]
+        if codes:
+            return registry.codes(names)
+        return registry.fields(names)
+
+    def list(self, name: str = '') -> tuple[list[str], list[str]]:
+        """
+        Get sorted names of subfolders and items of a folder.
+        """
+        folder = os.path.relpath(os.path.join(self.path, name), self.path)
+        with self.lock:
+            self.index.refresh()
+            try:
+                return self.index.list('' if folder == '.' else folder)
+            except KeyError:
+                raise exception.NotFoundStorageError
+
+    def tree(self, name: str = '') -> str:
+        """
+        Render a folder as a tree like `pass ls`.
+        """
+        folder = os.path.relpath(os.path.join(self.path, name), self.path)
+        folder = '' if folder == '.' else folder
+        with self.lock:
+            self.index.refresh()
+            if folder not in self.index.tree:
+                raise exception.NotFoundStorageError
+            lines = [folder or 'Password Store']
+            # prefixes of the parent levels, which depend on whether they are last
+            prefixes = []
+            for depth, item, last, is_dir in self.index.walk(folder):
+                del prefixes[depth:]
+                lines.append(''.join(prefixes) + ('└── ' if last else '├── ') + item)
+                prefixes.append('    ' if last else '│   ')
+        return '\n'.join(lines)
+
+    @locked
+    def migrate(self) -> None:
+        """
+        Reencrypt every item and the vault id using the v2 format.
+        """
+        if not self.is_open:
+            raise exception.LockedStorageError
+
+        key = self._get_key()
 
-    def find(self, name: str = '') -> str:
         for path, foldernames, filenames in os.walk(self.path):
+            foldernames[:] = [f for f in foldernames if not f.startswith('.')]
             for filename in filenames:
-                if filename.startswith('.urn:uuid:'):
+                if filename.startswith('.'):
+                    continue
+
+                filepath = os.path.join(path, filename)
+                with open(filepath, 'r') as f:
+                    data = f.read()
+                if get_version(data) != 1:
                     continue
-                if name in filename:
-                    yield filename
+
+                self._atomic_write(filepath, encrypt_v2(decrypt(data, self.password), key))
+
+        # the vault id is migrated last, so an interrupted migration leaves
+        # a v1 vault with some v2 items, which is still readable
+        id_path = os.path.join(self.path, f'.{self.id.urn}')
+        self._atomic_write(id_path, encrypt_v2(str(self.id), key))
+        self.version = 2
+        if self._index:
+            self._index.key = None
+            self._index.save()
+        self._generation += 1
+
+    def _on_change(self, kind: str, path: str, is_dir: bool) -> None:
+        with self.lock:
+            if kind == 'reset':
+                self.cache.invalidate_folder(self.path)
+                if self._index is not None:
+                    self._index.invalidate()
+                return
+
+            if is_dir:
+                self.cache.invalidate_folder(os.path.join(self.path, path))
+            else:
+                self.cache.invalidate(os.path.join(self.path, path))
+
+            if self._index is not None:
+                self._index.invalidate(os.path.dirname(path))
+                if is_dir:
+                    self._index.invalidate(path)
+
+    def _read(self, path: str) -> str:
+        with open(path, 'r') as f:
+            data = f.read()
+
+        if get_version(data) == 2:
+            # an item of a partially migrated vault, or of a vault migrated
+            # by another process, so new items are written as v2 items too
+            return decrypt_v2(data, self._get_key())
+        return decrypt(data, self.password)
+
+    def _get_key(self) -> bytes:
+        # the key is derived once, without blocking on the storage lock,
+        # which may be held by a caller waiting for items being decrypted
+        if key := self.key:
+            return key
+        with self.key_lock:
+            if self.key is None:
+                self.key = derive_key(self.password, self.id.bytes)
+            return self.key
+
+    def _encrypt(self, text: str) -> str:
+        if self.key:
+            return encrypt_v2(text, self.key)
+        return encrypt(text, self.password)
+
+    def _write(self, path: str, text: str) -> None:
+        self._atomic_write(path, self._encrypt(text))
+
+    def _atomic_create(self, path: str, data: str) -> bool:
+        """
+        Write a new file atomically, or return False if the file exists.
+        """
+        folder, filename = os.path.split(path)
+        with tempfile.NamedTemporaryFile(
+                'w', dir=folder, prefix=f'.{filename}.', delete=False) as f:
+            f.write(data)
+        try:
+            # unlike os.replace(), a link never overwrites the file
+            os.link(f.name, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(f.name)
+
+    def _atomic_write(self, path: str, data: str) -> None:
+        folder, filename = os.path.split(path)
+        with tempfile.NamedTemporaryFile(
+                'w', dir=folder, prefix=f'.{filename}.', delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
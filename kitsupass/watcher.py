@@ -0,0 +1,200 @@
+import abc
+import ctypes
+import os
+import select
+import struct
+import threading
+
+WATCHER = os.getenv('KITSUPASS_WATCHER', 'auto')
+WATCHER_INTERVAL = float(os.getenv('KITSUPASS_WATCHER_INTERVAL', 2))
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+IN_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+           | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT = struct.Struct('iIII')
+
+
+class Watcher(abc.ABC):
+    """
+    Watcher of changes made to the storage folder by any program.
+
+    Subscribers are called from the watcher thread with the kind of the
+    change ('created', 'modified', 'deleted' or 'reset' when changes were
+    lost), the path relative to the storage and whether it is a folder.
+    A rename is reported as a deletion and a creation. Hidden files and
+    folders, such as .git, are not watched.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.subscribers = []
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def subscribe(self, callback) -> None:
+        self.subscribers.append(callback)
+
+    def emit(self, kind: str, path: str, is_dir: bool = False) -> None:
+        for callback in self.subscribers:
+            callback(kind, path, is_dir)
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    @abc.abstractmethod
+    def run(self) -> None:
+        pass
+
+
+class InotifyWatcher(Watcher):
+    """
+    Watcher using inotify, which is notified by the kernel immediately.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.folders = {}
+        # the pipe wakes the thread up on stop
+        self.wakeup = os.pipe()
+        # watches are added before the thread starts, so no change is missed
+        self.add(os.path.join(self.path, ''))
+
+    def add(self, folder: str) -> None:
+        for path, foldernames, filenames in os.walk(os.path.join(self.path, folder)):
+            foldernames[:] = [f for f in foldernames if not f.startswith('.')]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), IN_MASK)
+            if wd >= 0:
+                self.folders[wd] = os.path.relpath(path, self.path)
+
+    def stop(self) -> None:
+        os.write(self.wakeup[1], b'\0')
+        super().stop()
+        os.close(self.fd)
+        for fd in self.wakeup:
+            os.close(fd)
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            ready, _, _ = select.select([self.fd, self.wakeup[0]], [], [])
+            if self.fd not in ready:
+                continue
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, size = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size:offset + EVENT.size + size].rstrip(b'\0')
+                offset += EVENT.size + size
+                self.handle(wd, mask, os.fsdecode(name))
+
+    def handle(self, wd: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            self.emit('reset', '', True)
+            return
+
+        if mask & IN_IGNORED:
+            self.folders.pop(wd, None)
+            return
+
+        folder = self.folders.get(wd)
+        if folder is None or mask & IN_DELETE_SELF or name.startswith('.'):
+            return
+
+        path = os.path.normpath(os.path.join(folder, name))
+        is_dir = bool(mask & IN_ISDIR)
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            if is_dir:
+                self.add(path)
+            self.emit('created', path, is_dir)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self.emit('deleted', path, is_dir)
+        elif mask & IN_CLOSE_WRITE:
+            self.emit('modified', path, is_dir)
+
+
+class PollingWatcher(Watcher):
+    """
+    Watcher comparing snapshots of the storage folder, for systems or file
+    systems without inotify.
+    """
+
+    def __init__(self, path: str, interval: float = WATCHER_INTERVAL):
+        super().__init__(path)
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self) -> dict:
+        snapshot = {}
+        for path, foldernames, filenames in os.walk(self.path):
+            foldernames[:] = [f for f in foldernames if not f.startswith('.')]
+            for name in foldernames + filenames:
+                if name.startswith('.'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(path, name))
+                except FileNotFoundError:
+                    continue
+                relpath = os.path.relpath(os.path.join(path, name), self.path)
+                snapshot[relpath] = (name in foldernames, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def poll(self) -> None:
+        snapshot = self.scan()
+        for path, item in self.snapshot.items():
+            if path not in snapshot:
+                self.emit('deleted', path, item[0])
+        for path, item in snapshot.items():
+            old = self.snapshot.get(path)
+            if old is None or old[:2] != item[:2]:
+                if old is not None:
+                    self.emit('deleted', path, old[0])
+                self.emit('created', path, item[0])
+            elif old != item and not item[0]:
+                self.emit('modified', path, item[0])
+        self.snapshot = snapshot
+
+
+def get_watcher(path: str) -> Watcher | None:
+    """
+    Get a watcher selected by KITSUPASS_WATCHER: inotify, poll, none or auto,
+    which prefers inotify and falls back to polling.
+    """
+    if WATCHER in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError):
+            if WATCHER == 'inotify':
+                raise
+    if WATCHER in ('auto', 'poll'):
+        return PollingWatcher(path)
@@ -13,10 +13,12 @@ setup(
             'bottle==0.13.2',
             'jwskate==0.11.1',
             'SecretStorage==3.3.3',
+            'waitress==3.0.2',
         ],
         'buttercup':  [
             'bottle==0.13.2',
             'jwskate==0.11.1',
+            'waitress==3.0.2',
         ],
         'keyring':  [
             'SecretStorage==3.3.3',
@@ -32,5 +34,5 @@ setup(
     ]},
     include_package_data=True,
     package_dir={'': '.'},
-    package_data={'kitsupass.buttercup': ['*.service']}
+    package_data={'kitsupass.buttercup': ['*.service', 'public_suffix_list.dat']}
 )
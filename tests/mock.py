@@ -1,3 +1,8 @@
+import uuid
+
+from kitsupass.entry import Entry
+from kitsupass.search import NameTable
+
 CONFIG = {}
 
 
@@ -31,7 +36,10 @@ class Notify:
 
 class Storage:
     def __init__(self):
+        self.id = uuid.uuid4()
         self.data = {}
+        self.generation = 0
+        self.is_open = True
 
     def open(self):
         pass
@@ -41,6 +49,7 @@ class Storage:
 
     def insert(self, name, data):
         self.data[name] = data
+        self.generation += 1
 
     def edit(self, name, data):
         self.data[name] = data
@@ -48,6 +57,18 @@ class Storage:
     def show(self, name = ''):
         return self.data[name]
 
+    def show_many(self, names):
+        return [self.data[name] for name in names]
+
+    def entry(self, name):
+        return Entry(self.data[name])
+
+    def entries(self, names):
+        return [Entry(self.data[name]) for name in names]
+
+    def meta(self, name):
+        return Entry(self.data[name]).meta()
+
     def delete(self, name):
         self.data.pop(name, None)
 
@@ -58,9 +79,23 @@ class Storage:
         self.data[new_name] = self.data[name]
 
     def find(self, name = ''):
-        for k, v in self.data:
+        for k in self.data:
             if name in k:
-                yield v
+                yield k
+
+    def select(self, names):
+        return [name for name in dict.fromkeys(names) if name in self.data]
+
+    def otp(self, names=None, codes=True):
+        items = []
+        for name in sorted(self.data) if names is None else names:
+            entry = Entry(self.data[name])
+            if uri := entry.get('TOTP'):
+                items.append({'name': name, 'TOTP': uri, 'URL': entry.get('URL')})
+        return items
+
+    def fuzzy(self, pattern, limit = 0):
+        return NameTable(self.data).search(pattern, limit)
 
 
 from kitsupass.buttercup import config
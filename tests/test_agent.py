@@ -0,0 +1,111 @@
+import os
+import socket
+import threading
+import unittest.mock
+
+from kitsupass import agent, exception
+
+from .test_storage import StorageTestCase
+
+
+class TestAgent(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage.close()
+        self.socket_path = os.path.join(self.tmp.name, 'agent', 'agent.sock')
+        self.agent = self.start()
+        self.client = agent.AgentStorage()
+        self.client.path = self.socket_path
+
+    def tearDown(self):
+        if self.agent.running:
+            self.agent.lock()
+            # wake the agent up to notice it should stop
+            self.client.connect()
+        self.thread.join(5)
+        super().tearDown()
+
+    def start(self, timeout: int = 60) -> agent.Agent:
+        server = agent.Agent(self.socket_path, timeout=timeout)
+        server.storage.path = self.path
+        server.running = True
+        self.thread = threading.Thread(target=server.run)
+        self.thread.start()
+        return server
+
+    def test_unlock(self):
+        self.assertTrue(self.client.connect())
+        self.assertFalse(self.client.is_open)
+        with self.assertRaises(exception.LockedStorageError):
+            self.client.show('example.com')
+
+        # the agent has no password to open the storage with
+        with self.assertRaises(exception.InvalidPasswordStorageError):
+            self.client.call('open')
+        with self.assertRaises(exception.InvalidPasswordStorageError):
+            self.client.call('unlock', 'wrong')
+        self.assertEqual(self.client.call('unlock', self.password), str(self.id))
+        self.assertEqual(self.client.call('open'), str(self.id))
+
+        self.assertTrue(self.client.is_open)
+        self.assertEqual(self.client.entry('example.com').get('username'), 'user')
+        self.assertEqual(list(self.client.find('otp')), ['sub/otp:example'])
+
+    def test_errors(self):
+        self.client.call('unlock', self.password)
+        with self.assertRaises(exception.NotFoundStorageError):
+            self.client.show('missing')
+        # errors other than storage errors are reported too
+        with self.assertRaises(exception.StorageError):
+            self.client.insert('missing/folder/item', 'secret\n')
+        with self.assertRaises(exception.StorageError):
+            self.client.call('unknown')
+        self.assertTrue(self.client.is_open)
+
+    def test_lock(self):
+        self.client.call('unlock', self.password)
+        self.client.close()
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertFalse(self.client.connect())
+
+    def test_timeout(self):
+        self.agent.lock()
+        self.client.connect()
+        self.thread.join(5)
+
+        self.agent = self.start(timeout=0.1)
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_running(self):
+        with self.assertRaises(exception.RunningAgentError):
+            agent.Agent(self.socket_path)
+        self.assertTrue(self.client.connect())
+
+        # a socket of an agent which is gone
+        path = os.path.join(os.path.dirname(self.socket_path), 'stale.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(path)
+        agent.Agent(path).server_close()
+
+    def test_peer(self):
+        with unittest.mock.patch.object(agent, 'get_peer_uid', lambda sock: os.getuid() + 1):
+            with self.assertRaises(exception.UnsafeAgentError):
+                self.client.call('ping')
+            self.assertFalse(self.client.connect())
+        self.assertTrue(self.client.connect())
+
+    def test_folder(self):
+        folder = os.path.dirname(self.socket_path)
+        os.chmod(folder, 0o777)
+        try:
+            with self.assertRaises(exception.UnsafeAgentError):
+                self.client.call('ping')
+            self.assertFalse(self.client.connect())
+            with self.assertRaises(exception.UnsafeAgentError):
+                agent.Agent(os.path.join(folder, 'other.sock'))
+        finally:
+            os.chmod(folder, 0o700)
@@ -1,8 +1,11 @@
 import base64
+import functools
+import http.client
 import json
 import random
 import string
 import subprocess
+import threading
 import unittest
 
 import bottle
@@ -11,12 +14,15 @@ from jwskate import Jwk
 from webtest import TestApp
 
 from .mock import Notify, Storage, getConfigValue, setConfigValue
+from .test_storage import StorageTestCase
 
 from kitsupass.buttercup import api
 from kitsupass.buttercup.api import app
+from kitsupass.buttercup.application import KeepAliveRequestHandler, ThreadingWSGIServer
 from kitsupass.buttercup.auth import (
-    generateBrowserKeys, deriveSecretKey, decryptAPIPayload, encryptAPIPayload,
+    generateBrowserKeys, deriveSecretKey, decryptAPIPayload, encryptAPIPayload, getSession,
 )
+from kitsupass.buttercup.search import DomainIndex, getRegistrableDomain
 from kitsupass.buttercup.symbols import API_KEY_ALGO, API_KEY_CURVE
 
 
@@ -99,6 +105,25 @@ class TestButtercup(unittest.TestCase):
         self.assertEqual(response.status_int, 200)
         self.assertEqual(response.text, 'OK')
 
+    def test_use_code(self):
+        client_id = self.client_id.upper()
+        self.app.app.set_code('CODE')
+        self.assertFalse(self.app.app.use_code('WRONG'))
+
+        data = {
+            'code': 'CODE',
+            'id': client_id,
+            'publicKey': self.client_public_key.to_json(),
+        }
+        response = self.app.post_json('/v1/auth/response', data)
+        self.assertEqual(response.json['publicKey'], self.browser_public_key.to_json())
+        self.assertIn(client_id, getConfigValue('browserClients'))
+        self.assertIsNone(self.app.app.auth_code)
+
+        # the code is used only once
+        self.app.post_json('/v1/auth/response', data, status=403)
+        self.assertFalse(self.app.app.use_code('CODE'))
+
     def test_entries(self):
         headers = {
             'Authorization': f'test {self.client_id}',
@@ -113,3 +138,228 @@ class TestButtercup(unittest.TestCase):
         response = self.app.get('/v1/entries?type=url&url=https://test.example.com', headers=headers)
         self.assertEqual(response.status_int, 200)
         self.assertEqual(json.loads(decryptAPIPayload(self.client_id, response.text)), {'results': []})
+
+    def test_entries_url(self):
+        self.app.app.storage.insert('web/example.com', 'secret\nURL: https://accounts.example.com/login')
+        self.app.app.storage.insert('mail.example.com (2)', 'secret\n')
+        self.app.app.storage.insert('mail.example.com', 'secret\n')
+        self.app.app.storage.insert('notexample.com', 'secret\n')
+
+        headers = {
+            'Authorization': f'test {self.client_id}',
+        }
+        response = self.app.get('/v1/entries?type=url&url=https://mail.example.com/inbox', headers=headers)
+        data = json.loads(decryptAPIPayload(self.client_id, response.text))
+        self.assertEqual([i['id'] for i in data['results']], [
+            'mail.example.com', 'mail.example.com (2)', 'web/example.com',
+        ])
+
+    def test_entries_specific(self):
+        storage = self.app.app.storage
+        for name in ('example.com', 'sub/example.net', 'example.org'):
+            storage.insert(name, f'secret {name}\n')
+
+        headers = {
+            'Authorization': f'test {self.client_id}',
+            'X-Content-Type': 'application/json',
+        }
+        request_data = {'entries': [
+            {'entryID': 'example.org', 'sourceID': str(storage.id)},
+            {'entryID': 'missing', 'sourceID': str(storage.id)},
+            {'entryID': 'example.com', 'sourceID': 'other'},
+            {'entryID': 'sub/example.net', 'sourceID': str(storage.id)},
+        ]}
+        response = self.app.post(
+            '/v1/entries/specific',
+            encryptAPIPayload(self.client_id, json.dumps(request_data).encode()),
+            headers=headers,
+        )
+        data = json.loads(decryptAPIPayload(self.client_id, response.text))
+        self.assertEqual([i['id'] for i in data['results']], ['example.org', 'sub/example.net'])
+        self.assertEqual(data['results'][1]['properties']['password'], 'secret sub/example.net')
+
+    def test_otps(self):
+        self.app.app.storage.insert('github.com', 'secret\nURL: https://github.com\nTOTP: otpauth://totp/github?secret=JBSWY3DPEHPK3PXP\n')
+        self.app.app.storage.insert('example.com', 'secret\n')
+
+        headers = {
+            'Authorization': f'test {self.client_id}',
+        }
+        response = self.app.get('/v1/otps', headers=headers)
+        data = json.loads(decryptAPIPayload(self.client_id, response.text))
+        self.assertEqual(data['otps'], [{
+            'sourceID': str(self.app.app.storage.id),
+            'entryID': 'github.com',
+            'entryProperty': 'TOTP',
+            'entryTitle': 'github.com',
+            'loginURL': 'https://github.com',
+            'otpURL': 'otpauth://totp/github?secret=JBSWY3DPEHPK3PXP',
+        }])
+
+    def test_domain_index(self):
+        self.assertEqual(getRegistrableDomain('mail.example.co.uk'), 'example.co.uk')
+        self.assertEqual(getRegistrableDomain('example.com'), 'example.com')
+        self.assertEqual(getRegistrableDomain('co.uk'), 'co.uk')
+        self.assertEqual(getRegistrableDomain('user.github.io'), 'user.github.io')
+        self.assertEqual(getRegistrableDomain('localhost'), 'localhost')
+        self.assertEqual(getRegistrableDomain('127.0.0.1'), '127.0.0.1')
+
+        index = DomainIndex([
+            ('github.com', {}),
+            ('user.github.io', {}),
+            ('other.github.io', {}),
+            ('router', {'URL': '192.168.0.1:8080'}),
+            ('otp:example', {'URL': 'not a url'}),
+        ])
+        self.assertEqual(index.lookup('https://user.github.io/page'), ['user.github.io'])
+        self.assertEqual(index.lookup('https://gist.github.com'), ['github.com'])
+        self.assertEqual(index.lookup('http://192.168.0.1/'), ['router'])
+        self.assertEqual(index.lookup(''), [])
+
+    def test_session(self):
+        data = encryptAPIPayload(self.client_id, b'payload')
+        self.assertEqual(data.split('$')[2], encryptAPIPayload(self.client_id, b'payload').split('$')[2])
+        self.assertEqual(len(getSession(self.client_id).keys), 1)
+
+        self.client_private_key = Jwk.generate(kty=API_KEY_ALGO[:2], crv=API_KEY_CURVE)
+        self.client_public_key = self.client_private_key.public_jwk()
+        setConfigValue('browserClients', {
+            self.client_id: self.client_public_key.to_dict(),
+        })
+        self.assertEqual(len(getSession(self.client_id).keys), 0)
+
+        data = encryptAPIPayload(self.client_id, b'payload')
+        self.assertEqual(decryptAPIPayload(self.client_id, data), b'payload')
+
+    def test_entries_pagination(self):
+        for name in ('example.com', 'example.net', 'example.org'):
+            self.app.app.storage.insert(name, f'secret\nusername: {name}')
+
+        headers = {
+            'Authorization': f'test {self.client_id}',
+        }
+        response = self.app.get('/v1/entries?type=term&term=example&limit=2&metadataOnly=1', headers=headers)
+        data = json.loads(decryptAPIPayload(self.client_id, response.text))
+        self.assertEqual([i['id'] for i in data['results']], ['example.com', 'example.net'])
+        self.assertNotIn('password', data['results'][0]['properties'])
+
+        response = self.app.get(f'/v1/entries?type=term&term=example&limit=2&cursor={data["nextCursor"]}', headers=headers)
+        data = json.loads(decryptAPIPayload(self.client_id, response.text))
+        self.assertEqual([i['id'] for i in data['results']], ['example.org'])
+        self.assertEqual(data['results'][0]['properties']['password'], 'secret')
+        self.assertNotIn('nextCursor', data)
+
+        response = self.app.get('/v1/vaults-tree?limit=1', headers=headers)
+        data = json.loads(decryptAPIPayload(self.client_id, response.text))
+        entries = data['tree'][str(self.app.app.storage.id)]['entries']
+        self.assertEqual([i['id'] for i in entries], ['example.com'])
+        self.assertIn('nextCursor', data)
+
+    def test_entries_metadata_only(self):
+        self.app.app.storage.insert('example.com', 'secret\nusername: alice')
+        headers = {
+            'Authorization': f'test {self.client_id}',
+        }
+        for value, metadata_only in (('true', True), ('1', True), ('False', False), ('0', False)):
+            response = self.app.get(f'/v1/entries?type=term&term=example&metadataOnly={value}', headers=headers)
+            data = json.loads(decryptAPIPayload(self.client_id, response.text))
+            self.assertEqual('password' not in data['results'][0]['properties'], metadata_only)
+
+        response = self.app.get('/v1/entries?type=term&term=example&metadataOnly=yes', headers=headers, expect_errors=True)
+        self.assertEqual(response.status_int, 400)
+
+    def test_vaults_tree_etag(self):
+        headers = {
+            'Authorization': f'test {self.client_id}',
+        }
+        response = self.app.get('/v1/vaults-tree', headers=headers)
+        self.assertEqual(response.status_int, 200)
+        etag = response.headers['ETag']
+
+        response = self.app.get('/v1/vaults-tree', headers=headers | {'If-None-Match': etag})
+        self.assertEqual(response.status_int, 304)
+
+        self.app.app.storage.insert('example.com', 'secret')
+        response = self.app.get('/v1/vaults-tree', headers=headers | {'If-None-Match': etag})
+        self.assertEqual(response.status_int, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        etag = response.headers['ETag']
+
+        self.app.app.storage.is_open = False
+        response = self.app.get('/v1/vaults-tree', headers=headers | {'If-None-Match': etag})
+        self.assertEqual(response.status_int, 200)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        # both requests have to be handled at the same time to get through
+        self.barrier = threading.Barrier(2, timeout=5)
+        self.server = ThreadingWSGIServer(('localhost', 0), functools.partial(KeepAliveRequestHandler, quiet=True))
+        self.server.set_app(self.application)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(5)
+
+    def application(self, environ, start_response):
+        if environ['PATH_INFO'] == '/wait':
+            self.barrier.wait()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [environ['PATH_INFO'].encode()]
+
+    def request(self, connection, path, body=None) -> bytes:
+        connection.request('POST' if body else 'GET', path, body)
+        response = connection.getresponse()
+        self.assertEqual(response.version, 11)
+        self.assertFalse(response.will_close)
+        return response.read()
+
+    def test_keep_alive(self):
+        connections = [
+            http.client.HTTPConnection('localhost', self.server.server_port, timeout=5)
+            for i in range(2)
+        ]
+        results = []
+        threads = [
+            threading.Thread(target=lambda c=c: results.append(self.request(c, '/wait')))
+            for c in connections
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, [b'/wait', b'/wait'])
+
+        for connection in connections:
+            sock = connection.sock
+            # a body left unread by the application doesn't break the next request
+            self.assertEqual(self.request(connection, '/', b'data'), b'/')
+            self.assertEqual(self.request(connection, '/next'), b'/next')
+            self.assertIs(connection.sock, sock)
+            connection.close()
+
+
+class TestLockedStorage(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage.close()
+        self.app = TestApp(app)
+        self.app.app.create(storage=self.storage)
+
+        generateBrowserKeys()
+        self.client_id = ''.join(random.choice(string.ascii_uppercase) for i in range(26))
+        setConfigValue('browserClients', {
+            self.client_id: Jwk.generate(kty=API_KEY_ALGO[:2], crv=API_KEY_CURVE).public_jwk().to_dict(),
+        })
+
+    def test_entries(self):
+        headers = {
+            'Authorization': f'test {self.client_id}',
+        }
+        response = self.app.get('/v1/entries?type=term&term=exa', headers=headers)
+        data = json.loads(decryptAPIPayload(self.client_id, response.text))
+        self.assertEqual([i['id'] for i in data['results']], ['example.com', 'sub/otp:example'])
+        self.assertNotIn('password', data['results'][0]['properties'])
@@ -0,0 +1,27 @@
+import unittest
+
+from kitsupass.entry import Entry
+
+
+class TestEntry(unittest.TestCase):
+    def test_fields(self):
+        text = 'secret \nusername: alice\nURL:https://example.com\nhttps://example.org\nusername: bob\nfree text\n'
+        entry = Entry(text)
+        self.assertEqual(str(entry), text)
+        self.assertEqual(entry.password, 'secret ')
+        self.assertEqual(entry.get('username'), 'alice')
+        self.assertEqual(entry['URL'], 'https://example.com')
+        self.assertEqual(entry.get_all('username'), ['alice', 'bob'])
+        self.assertEqual(list(entry.fields), ['username', 'URL'])
+        self.assertNotIn('https', entry)
+        self.assertIsNone(entry.get('TOTP'))
+        self.assertEqual(entry.notes(exclude=('username',)), 'URL:https://example.com\nhttps://example.org\nfree text\n\n')
+        self.assertEqual(entry.meta(), {'username': 'alice', 'URL': 'https://example.com'})
+        self.assertEqual(Entry('secret\nTOTP: otpauth://totp/x').meta(), {'TOTP': True})
+
+    def test_create(self):
+        entry = Entry.create('secret', {'username': 'alice', 'URL': None}, 'notes\n')
+        self.assertEqual(str(entry), 'secret\nusername: alice\nnotes\n')
+        self.assertEqual(Entry(str(entry)), entry)
+        self.assertEqual(str(Entry.create('secret')), 'secret\n')
+        self.assertEqual(Entry.create('secret').password, 'secret')
@@ -0,0 +1,35 @@
+import io
+
+from importer.csv import drop_imported, read_batches
+
+from .test_storage import StorageTestCase
+
+
+class TestImporter(StorageTestCase):
+    def test_read_batches(self):
+        f = io.StringIO(
+            'url,username,password\n'
+            'https://a.example.com/login,alice,first\n'
+            'not a url,bob,second\n'
+            'https://b.example.com,,third\n')
+        self.assertEqual(list(read_batches(f, size=1)), [
+            (1, [('a.example.com', 'first\nusername: alice\nURL: https://a.example.com/login\n')]),
+            (3, [('b.example.com', 'third\nURL: https://b.example.com\n')]),
+            (3, []),
+        ])
+
+    def test_drop_imported(self):
+        self.storage.insert('example.org', 'other\n')
+        self.storage.insert('example.org', 'first\n')
+        self.storage.insert('example.org', 'second\n')
+        batch = [
+            ('example.org', 'first\n'),
+            ('example.org', 'second\n'),
+            ('example.org', 'second\n'),
+            ('example.net', 'third\n'),
+        ]
+        # an interrupted import inserted the first two items
+        self.assertEqual(drop_imported(self.storage, batch), [
+            ('example.org', 'second\n'),
+            ('example.net', 'third\n'),
+        ])
@@ -0,0 +1,229 @@
+import collections
+import ctypes
+import errno
+import os
+import tempfile
+import unittest
+import uuid
+
+from kitsupass import exception, keyring
+
+
+class SecretService:
+    """
+    In-process stand-in of the secretstorage module.
+    """
+
+    class SecretStorageException(Exception):
+        pass
+
+    class Item:
+        def __init__(self, service, attributes, secret):
+            self.service = service
+            self.attributes = attributes
+            self.secret = secret
+
+        def get_secret(self):
+            self.service.calls['get_secret'] += 1
+            if self not in self.service.items:
+                raise SecretService.SecretStorageException('item not found')
+            return self.secret.encode()
+
+        def delete(self):
+            self.service.items.remove(self)
+
+    class Collection:
+        def __init__(self, service):
+            self.service = service
+            self.locked = True
+
+        def is_locked(self):
+            return self.locked
+
+        def unlock(self):
+            self.service.calls['unlock'] += 1
+            self.locked = False
+
+        def search_items(self, attributes):
+            self.service.calls['search_items'] += 1
+            for item in self.service.items:
+                if attributes.items() <= item.attributes.items():
+                    yield item
+
+        def create_item(self, label, attributes, secret, replace=False):
+            if replace:
+                for item in list(self.search_items(attributes)):
+                    item.delete()
+            item = SecretService.Item(self.service, attributes, secret)
+            self.service.items.append(item)
+            return item
+
+    class Connection:
+        def close(self):
+            pass
+
+    def __init__(self):
+        self.items = []
+        self.calls = collections.Counter()
+
+    def dbus_init(self):
+        self.calls['dbus_init'] += 1
+        return self.Connection()
+
+    def get_default_collection(self, connection):
+        self.calls['get_default_collection'] += 1
+        return self.Collection(self)
+
+
+class KeyringTestCase(unittest.TestCase):
+    def setUp(self):
+        self.id = uuid.uuid4()
+        self.keyring = keyring.KEYRING
+
+    def tearDown(self):
+        keyring.KEYRING.close()
+        keyring.KEYRING = self.keyring
+
+    def assertPassword(self):
+        self.assertIsNone(keyring.load_password(self.id))
+        keyring.save_password(self.id, 'password')
+        keyring.save_password(self.id, 'new password')
+        self.assertEqual(keyring.load_password(self.id), 'new password')
+
+        keyring.remove_password(self.id)
+        self.assertIsNone(keyring.load_password(self.id))
+
+
+class TestSecretServiceKeyring(KeyringTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = SecretService()
+        self.secretstorage = keyring.secretstorage
+        keyring.secretstorage = self.service
+        keyring.KEYRING = keyring.SecretServiceKeyring()
+
+    def tearDown(self):
+        super().tearDown()
+        keyring.secretstorage = self.secretstorage
+
+    def test_password(self):
+        self.assertPassword()
+        self.assertEqual(len(self.service.items), 0)
+
+    def test_pool(self):
+        keyring.save_password(self.id, 'password')
+        keyring.KEYRING.items.clear()
+        self.service.calls.clear()
+
+        for i in range(10):
+            self.assertEqual(keyring.load_password(self.id), 'password')
+        self.assertEqual(self.service.calls['dbus_init'], 0)
+        self.assertEqual(self.service.calls['unlock'], 0)
+        self.assertEqual(self.service.calls['search_items'], 1)
+
+    def test_reconnect(self):
+        keyring.save_password(self.id, 'password')
+        # the item was replaced by another process
+        self.service.items.clear()
+        keyring.KEYRING.get_collection().create_item('', {'URL': f'kitsupass://{self.id}'}, 'other')
+
+        self.assertEqual(keyring.load_password(self.id), 'other')
+        self.assertEqual(self.service.calls['dbus_init'], 2)
+
+
+class TestKernelKeyring(KeyringTestCase):
+    def setUp(self):
+        super().setUp()
+        keyring.KEYRING = keyring.KernelKeyring(keyring='user', timeout=60)
+        if not keyring.KEYRING.lib:
+            self.skipTest('libkeyutils is not available')
+
+    def test_password(self):
+        self.assertPassword()
+
+
+class TestKernelKeyringErrors(KeyringTestCase):
+    class Library:
+        """
+        libkeyutils denying access to the keyring.
+        """
+
+        def __getattr__(self, name):
+            def f(*args):
+                ctypes.set_errno(errno.EACCES)
+                return -1
+            return f
+
+    def setUp(self):
+        super().setUp()
+        keyring.KEYRING = keyring.KernelKeyring(keyring='session', timeout=60)
+        keyring.KEYRING.lib = self.Library()
+
+    def test_denied(self):
+        with self.assertRaises(exception.KeyringError):
+            keyring.KEYRING.load_password(self.id)
+        with self.assertRaises(exception.KeyringError):
+            keyring.remove_password(self.id)
+
+        # the password is asked again instead
+        self.assertIsNone(keyring.load_password(self.id))
+        self.assertIs(type(keyring.KEYRING), keyring.Keyring)
+        keyring.save_password(self.id, 'password')
+
+    def test_invalid(self):
+        with self.assertRaises(exception.InvalidKeyringError):
+            keyring.KernelKeyring(keyring='users')
+
+
+class TestFileKeyring(KeyringTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.key_path = os.path.join(self.tmp.name, 'runtime', 'keyring.key')
+        keyring.KEYRING = keyring.FileKeyring(os.path.join(self.tmp.name, 'cache'), self.key_path)
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp.cleanup()
+
+    def test_password(self):
+        self.assertPassword()
+
+    def test_logout(self):
+        keyring.save_password(self.id, 'password')
+        with open(keyring.KEYRING.get_path(self.id), 'r') as f:
+            self.assertNotIn('password', f.read())
+        self.assertEqual(os.stat(self.key_path).st_mode & 0o777, 0o600)
+
+        os.remove(self.key_path)
+        self.assertIsNone(keyring.load_password(self.id))
+
+    def test_unsafe(self):
+        keyring.save_password(self.id, 'password')
+        os.chmod(os.path.dirname(self.key_path), 0o777)
+        with self.assertRaises(exception.KeyringError):
+            keyring.KEYRING.get_key()
+
+        # a key other users could replace is not used
+        self.assertIsNone(keyring.load_password(self.id))
+        self.assertIs(type(keyring.KEYRING), keyring.Keyring)
+
+
+class TestKeyring(KeyringTestCase):
+    def test_backend(self):
+        keyring.KEYRING = None
+        backend = keyring.KEYRING_BACKEND
+        try:
+            keyring.KEYRING_BACKEND = 'none'
+            self.assertIs(type(keyring.get_keyring()), keyring.Keyring)
+            keyring.save_password(self.id, 'password')
+            self.assertIsNone(keyring.load_password(self.id))
+
+            keyring.KEYRING = None
+            keyring.KEYRING_BACKEND = 'secret-service'
+            with self.assertRaises(exception.InvalidKeyringError):
+                keyring.load_password(self.id)
+            self.assertIsNone(keyring.KEYRING)
+        finally:
+            keyring.KEYRING = keyring.Keyring()
+            keyring.KEYRING_BACKEND = backend
@@ -3,7 +3,9 @@ import subprocess
 import unittest
 
 from kitsupass.context import TMP
-from kitsupass.openssl import encrypt, decrypt
+from kitsupass.openssl import (
+    encrypt, decrypt, encrypt_v2, decrypt_v2, derive_key, get_version,
+)
 
 
 class TestOpenSSL(unittest.TestCase):
@@ -49,3 +51,17 @@ class TestOpenSSL(unittest.TestCase):
             )
             data, _ = openssl.communicate()
             self.assertEqual(decrypt(data.decode(), password), 'plaintext')
+
+    def test_encrypt_decrypt_v2(self):
+        key = derive_key('password', b'salt')
+
+        data = encrypt_v2('plaintext', key)
+        self.assertEqual(base64.b64decode(data)[:8], b'Kitsu_v2')
+        self.assertEqual(get_version(data), 2)
+        self.assertEqual(get_version(encrypt('plaintext', 'password')), 1)
+
+        text = decrypt_v2(data, key)
+        self.assertEqual(text, 'plaintext')
+
+        with self.assertRaises(ValueError):
+            decrypt_v2(data, derive_key('wrong', b'salt'))
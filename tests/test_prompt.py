@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from kitsupass import prompt
+
+PINENTRY = '''\
+import sys
+
+print('OK Pleased to meet you', flush=True)
+for line in sys.stdin:
+    command, _, arg = line.rstrip('\\n').partition(' ')
+    if command == 'SETDESC':
+        desc = arg
+    if command == 'GETPIN':
+        if desc == 'cancel':
+            print('ERR 83886179 Operation cancelled', flush=True)
+            continue
+        print('D pass%25word%0A', flush=True)
+    if command == 'BYE':
+        break
+    print('OK', flush=True)
+'''
+
+
+class TestPrompt(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'pinentry')
+        with open(path, 'w') as f:
+            f.write(f'#!{sys.executable}\n{PINENTRY}')
+        os.chmod(path, 0o700)
+        self.pinentry = prompt.PINENTRY
+        prompt.PINENTRY = path
+
+    def tearDown(self):
+        prompt.PINENTRY = self.pinentry
+        self.tmp.cleanup()
+
+    def test_pinentry(self):
+        self.assertEqual(prompt.ask_pinentry('Password', 'vault'), 'pass%word\n')
+        self.assertIsNone(prompt.ask_pinentry('Password', 'cancel'))
+
+        prompt.PINENTRY = os.path.join(self.tmp.name, 'missing')
+        self.assertIsNone(prompt.ask_pinentry('Password'))
+
+    def test_prompts(self):
+        self.assertEqual(prompt.get_prompts(), [])
+        self.assertEqual(prompt.get_prompts(has_terminal=True), [prompt.ask_terminal])
+        expected = prompt.ask_gtk if 'gi.repository.Gtk' in sys.modules else prompt.ask_helper
+        self.assertEqual(prompt.get_prompts(has_gui=True), [expected])
+
+        prompt.PROMPT = 'pinentry'
+        try:
+            self.assertEqual(prompt.ask_password('Password', has_terminal=True), 'pass%word\n')
+        finally:
+            prompt.PROMPT = 'auto'
@@ -0,0 +1,73 @@
+import random
+import unittest
+
+from kitsupass.search import Automaton, NameTable, fuzzy_score, get_matcher
+
+
+class TestSearch(unittest.TestCase):
+    def test_automaton(self):
+        rng = random.Random(0)
+        for i in range(200):
+            patterns = [''.join(rng.choices('abc', k=rng.randint(1, 4)))
+                        for j in range(rng.randint(1, 5))]
+            automaton = Automaton(patterns)
+            for j in range(20):
+                text = ''.join(rng.choices('abcd', k=rng.randint(0, 12)))
+                self.assertEqual(
+                    automaton.match(text),
+                    any(pattern in text for pattern in patterns),
+                    (patterns, text))
+
+        self.assertTrue(Automaton(['']).match('anything'))
+        self.assertFalse(Automaton([]).match('anything'))
+
+    def test_matcher(self):
+        match = get_matcher(['mail', 'bank'])
+        self.assertTrue(match('mail.example.com'))
+        self.assertTrue(match('mybank'))
+        self.assertFalse(match('Mail.example.com'))
+        self.assertTrue(get_matcher(['mail', 'BANK'], ignore_case=True)('MyBank'))
+
+        match = get_matcher(['*.com', 'otp:*'], mode='glob')
+        self.assertTrue(match('example.com'))
+        self.assertTrue(match('otp:example'))
+        self.assertFalse(match('example.com.au'))
+        self.assertTrue(get_matcher(['*.COM'], mode='glob', ignore_case=True)('example.com'))
+
+        match = get_matcher([r'^\d+$', 'x{2}'], mode='regex')
+        self.assertTrue(match('123'))
+        self.assertTrue(match('axxb'))
+        self.assertFalse(match('a1b'))
+
+        with self.assertRaises(ValueError):
+            get_matcher(['('], mode='regex')
+        with self.assertRaises(ValueError):
+            get_matcher(['a'], mode='fuzzy')
+
+    def test_fuzzy_score(self):
+        self.assertIsNone(fuzzy_score('abc', 'acb'))
+        # consecutive characters
+        self.assertGreater(fuzzy_score('mail', 'mail.com'), fuzzy_score('mail', 'm.a.i.l'))
+        # word boundaries
+        self.assertGreater(fuzzy_score('gh', 'git/hub'), fuzzy_score('gh', 'fight'))
+        self.assertGreater(fuzzy_score('ab', 'fooBar/a_b'), fuzzy_score('ab', 'cabbage'))
+
+    def test_name_table(self):
+        table = NameTable([
+            'work/github.com', 'personal/fight.club', 'gh.io', 'mail/google.com', 'ssh/GitHub',
+        ])
+        self.assertEqual(table.search('gh'), [
+            'gh.io', 'ssh/GitHub', 'work/github.com', 'personal/fight.club',
+        ])
+        self.assertEqual(table.search('gh', limit=2), ['gh.io', 'ssh/GitHub'])
+        self.assertEqual(table.search('GH'), ['ssh/GitHub'])
+        self.assertEqual(table.search('GiHu'), ['ssh/GitHub'])
+        self.assertEqual(table.search('g o o'), ['mail/google.com'])
+        self.assertEqual(table.search('', limit=1), ['gh.io'])
+        self.assertEqual(table.search('xyz'), [])
+
+        # İ lowercases to two characters
+        table = NameTable(['aİİİİİİ', 'bx', 'cy', 'dz', 'İİİx'])
+        self.assertEqual(table.search('y'), ['cy'])
+        self.assertEqual(table.search('x'), ['bx', 'İİİx'])
+        self.assertEqual(table.search('İx'), ['İİİx'])
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import threading
+import unittest
+
+from kitsupass.agent import Agent, AgentStorage
+
+from .test_storage import StorageTestCase
+
+# modules which are too slow to be imported by a command which doesn't use them
+HEAVY_MODULES = ('cryptography', 'pyotp', 'secretstorage', 'gi', 'kitsupass.storage')
+
+
+def importtime(*args, env: dict | None = None) -> subprocess.CompletedProcess:
+    """
+    Run a command, reporting the modules it imports on stderr.
+    """
+    return subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'kitsupass', *args],
+        capture_output=True,
+        env=os.environ | (env or {}),
+    )
+
+
+def imported_modules(process: subprocess.CompletedProcess) -> set[str]:
+    modules = set()
+    for line in process.stderr.decode().splitlines():
+        if line.startswith('import time:'):
+            self_time, cumulative, name = line[len('import time:'):].split('|')
+            if self_time.strip().isdigit():
+                modules.add(name.strip())
+    return modules
+
+
+class StartupMixin:
+    def assertStartup(self, process: subprocess.CompletedProcess):
+        # import times vary too much between machines to be tested, so only
+        # check which modules are imported
+        self.assertEqual(process.returncode, 0, process.stderr.decode())
+        modules = imported_modules(process)
+        self.assertIn('kitsupass', modules)
+        for name in modules:
+            self.assertFalse(name.startswith(HEAVY_MODULES), name)
+
+
+class TestStartup(StartupMixin, unittest.TestCase):
+    def test_version(self):
+        self.assertStartup(importtime('version'))
+
+    def test_help(self):
+        self.assertStartup(importtime('help'))
+
+
+class TestAgentStartup(StartupMixin, StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.socket_path = os.path.join(self.tmp.name, 'agent.sock')
+        self.agent = Agent(self.socket_path, timeout=10)
+        self.agent.storage = self.storage
+        self.thread = threading.Thread(target=self.agent.run)
+        self.thread.start()
+
+    def tearDown(self):
+        client = AgentStorage()
+        client.path = self.socket_path
+        client.close()
+        self.thread.join()
+        super().tearDown()
+
+    def test_find(self):
+        self.assertStartup(importtime('find', 'example', env={
+            'KITSUPASS_AGENT_SOCK': self.socket_path,
+        }))
@@ -0,0 +1,353 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+import uuid
+
+from kitsupass import exception, index, storage
+from kitsupass.openssl import encrypt
+
+class StorageTestCase(unittest.TestCase):
+    password = 'password'
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'vault')
+        os.makedirs(os.path.join(self.path, 'sub'))
+        self.patch(index, 'CACHE_PATH', os.path.join(self.tmp.name, 'cache'))
+        self.patch(storage, 'load_password', lambda id: None)
+        self.patch(storage, 'save_password', lambda id, password: None)
+        self.patch(storage, 'remove_password', lambda id: None)
+
+        self.id = uuid.uuid4()
+        with open(os.path.join(self.path, f'.{self.id.urn}'), 'w') as f:
+            f.write(encrypt(str(self.id), self.password))
+
+        self.storage = self.open()
+        self.storage.insert('example.com', 'secret\nusername: user\nURL: https://example.com\n')
+        self.storage.insert('sub/otp:example', 'secret\nTOTP: otpauth://totp/example?secret=JBSWY3DPEHPK3PXP\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def patch(self, target, name: str, value) -> None:
+        patcher = unittest.mock.patch.object(target, name, value)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def open(self) -> storage.Storage:
+        s = storage.Storage()
+        s.path = self.path
+        s.open(self.password)
+        return s
+
+
+class TestStorage(StorageTestCase):
+    def test_open(self):
+        s = storage.Storage()
+        s.path = self.path
+        with self.assertRaises(exception.InvalidPasswordStorageError):
+            s.open('wrong')
+
+        self.assertEqual(self.open().id, self.id)
+
+    def test_migrate(self):
+        self.storage.migrate()
+        self.assertIsNotNone(self.storage.key)
+
+        s = self.open()
+        self.assertIsNotNone(s.key)
+        self.assertEqual(s.show('example.com').split('\n')[0], 'secret')
+        with open(os.path.join(self.path, 'example.com'), 'r') as f:
+            self.assertFalse(f.read().startswith('U2FsdGVkX1'))
+
+    def test_partially_migrated(self):
+        # an item migrated by another process
+        key = storage.derive_key(self.password, self.id.bytes)
+        with open(os.path.join(self.path, 'example.org'), 'w') as f:
+            f.write(storage.encrypt_v2('migrated\n', key))
+
+        derived = []
+        derive_key = storage.derive_key
+        self.patch(storage, 'derive_key', lambda *args: derived.append(args) or derive_key(*args))
+        self.storage.cache.clear()
+        self.assertEqual(self.storage.show('example.org'), 'migrated\n')
+        self.storage.cache.clear()
+        self.assertEqual(self.storage.show('example.org'), 'migrated\n')
+        self.assertEqual(len(derived), 1)
+
+        self.storage.insert('example.net', 'secret\n')
+        with open(os.path.join(self.path, 'example.net'), 'r') as f:
+            self.assertFalse(f.read().startswith('U2FsdGVkX1'))
+
+    def test_index(self):
+        self.assertEqual(list(self.storage.find()), ['example.com', 'sub/otp:example'])
+        self.assertEqual(self.storage.index.meta('example.com'), {
+            'mtime': self.storage.index.meta('example.com')['mtime'],
+            'username': 'user',
+            'URL': 'https://example.com',
+        })
+        self.assertTrue(self.storage.index.meta('sub/otp:example')['TOTP'])
+
+        self.storage.move('example.com', 'sub/example.com')
+        self.storage.copy('sub/example.com', 'example.org')
+        self.storage.delete('sub/otp:example')
+        self.assertEqual(sorted(self.storage.index.entries), ['example.org', 'sub/example.com'])
+
+        s = self.open()
+        self.assertEqual(s.index.entries, self.storage.index.entries)
+
+    def test_move_folder(self):
+        os.makedirs(os.path.join(self.path, 'sub', 'deep'))
+        self.storage.insert('sub/deep/example.net', 'secret\nusername: deep\n')
+        self.assertEqual(len(list(self.storage.find())), 3)
+        self.storage.move('sub', 'other')
+        self.assertEqual(list(self.storage.find()), [
+            'example.com', 'other/deep/example.net', 'other/otp:example'])
+        self.assertEqual(self.storage.list(), (['other'], ['example.com']))
+        self.assertEqual(self.storage.meta('other/deep/example.net')['username'], 'deep')
+
+        s = self.open()
+        self.assertEqual(s.index.entries, self.storage.index.entries)
+        self.assertEqual(s.show('other/otp:example').split('\n')[0], 'secret')
+
+    def test_index_key(self):
+        derived = []
+        derive_key = index.derive_key
+        self.patch(index, 'derive_key', lambda *args: derived.append(args) or derive_key(*args))
+        list(self.storage.find())
+        for name in ('example.org', 'example.net', 'example.info'):
+            self.storage.insert(name, 'secret\n')
+        self.assertLessEqual(len(derived), 1)
+
+        # the saved index is loaded rather than rebuilt, before and after
+        # the vault is migrated
+        self.patch(index.Index, 'rebuild', None)
+        self.assertEqual(len(list(self.open().find('example'))), 5)
+        self.storage.migrate()
+        self.assertEqual(len(list(self.open().find('example'))), 5)
+
+    def test_index_refresh(self):
+        self.assertEqual(len(list(self.storage.find())), 2)
+        with open(os.path.join(self.path, 'sub', 'external'), 'w') as f:
+            f.write(encrypt('secret\nusername: external', self.password))
+
+        self.assertEqual(list(self.storage.find('external')), ['sub/external'])
+        self.assertEqual(self.storage.index.meta('sub/external')['username'], 'external')
+
+        os.remove(os.path.join(self.path, 'sub', 'external'))
+        self.assertEqual(list(self.storage.find('external')), [])
+
+    def test_index_refresh_edited(self):
+        self.assertEqual(self.storage.index.meta('example.com')['username'], 'user')
+        # edited in place by another program, which keeps the folder mtime
+        with open(os.path.join(self.path, 'example.com'), 'w') as f:
+            f.write(encrypt('secret\nusername: edited\nTOTP: otpauth://totp/x?secret=JBSWY3DPEHPK3PXP\n', self.password))
+
+        self.assertEqual(list(self.storage.find('example')), ['example.com', 'sub/otp:example'])
+        self.assertEqual(self.storage.index.meta('example.com')['username'], 'edited')
+        self.assertEqual([code['name'] for code in self.storage.otp()], ['example.com', 'sub/otp:example'])
+
+    def test_search(self):
+        self.storage.insert('Example.org', 'secret\n')
+        self.assertEqual(list(self.storage.search(['otp', '.org'])), ['Example.org', 'sub/otp:example'])
+        self.assertEqual(list(self.storage.search(['example.*'], 'glob', ignore_case=True)),
+                         ['Example.org', 'example.com'])
+
+        self.storage.close()
+        self.assertEqual(list(self.storage.search(['otp', '.org'])), ['Example.org', 'sub/otp:example'])
+
+    def test_iter_entries(self):
+        names = [f'item{i}' for i in range(20)]
+        for name in names:
+            self.storage.insert(name, f'{name}\n')
+        self.assertEqual(self.storage.show_many(names, workers=4), [f'{name}\n' for name in names])
+        self.assertEqual(self.storage.show_many(names[:3], workers=-1), [f'{name}\n' for name in names[:3]])
+
+        started = []
+        entry = self.storage.entry
+        self.storage.entry = lambda name: started.append(name) or time.sleep(0.01) or entry(name)
+        consumed = 0
+        for name, item in self.storage.iter_entries(names, workers=2):
+            consumed += 1
+            # at most twice as many items as workers are decrypted ahead
+            self.assertLessEqual(len(started), consumed + 4)
+
+        # pending items are cancelled when the consumer stops
+        started.clear()
+        items = self.storage.iter_entries(names, workers=2)
+        next(items)
+        items.close()
+        time.sleep(0.1)
+        self.assertLessEqual(len(started), 6)
+
+    def test_select(self):
+        self.assertEqual(
+            self.storage.select(['sub/otp:example', 'missing', 'example.com', 'sub/otp:example']),
+            ['sub/otp:example', 'example.com'])
+
+    def test_otp(self):
+        decrypted = []
+        iter_entries = self.storage.iter_entries
+        self.storage.iter_entries = lambda names: decrypted.extend(names) or iter_entries(names)
+
+        self.storage.insert('totp', 'secret\nURL: https://example.org\nTOTP: otpauth://totp/org?secret=JBSWY3DPEHPK3PXP&period=60\n')
+        codes = self.storage.otp()
+        self.assertEqual([code['name'] for code in codes], ['sub/otp:example', 'totp'])
+        self.assertEqual(codes[1]['URL'], 'https://example.org')
+        self.assertEqual(len(codes[1]['code']), 6)
+        self.assertLessEqual(codes[1]['remaining'], 60)
+
+        self.assertEqual([code['name'] for code in self.storage.otp(['totp', 'example.com'])], ['totp'])
+        self.storage.edit('totp', 'secret\n')
+        self.assertEqual([code['name'] for code in self.storage.otp()], ['sub/otp:example'])
+        self.assertEqual(decrypted, ['sub/otp:example', 'totp'])
+
+    def test_otp_invalid(self):
+        self.storage.insert('hex', 'secret\nTOTP: otpauth://totp/a?secret=1234\n')
+        self.storage.insert('hotp', 'secret\nTOTP: otpauth://hotp/a?secret=JBSWY3DPEHPK3PXP&counter=1\n')
+        self.assertEqual([code['name'] for code in self.storage.otp()], ['sub/otp:example'])
+        self.assertEqual(self.storage.otp(codes=False), [{
+            'name': 'sub/otp:example',
+            'TOTP': 'otpauth://totp/example?secret=JBSWY3DPEHPK3PXP',
+            'URL': None,
+        }])
+
+    def test_otp_migrated(self):
+        # items migrated by another process are decrypted with a key derived
+        # by a worker while the storage lock is taken by other threads
+        for i in range(8):
+            self.storage.insert(f'totp{i}', 'secret\nTOTP: otpauth://totp/a?secret=JBSWY3DPEHPK3PXP\n')
+        self.assertIsNone(self.storage.key)
+        self.open().migrate()
+        self.storage.cache.clear()
+        self.patch(storage, 'WORKERS', 4)
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.storage.otp()))
+            for i in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual([len(codes) for codes in results], [9, 9])
+        self.assertIsNotNone(self.storage.key)
+
+    def test_resolve(self):
+        self.storage.insert('host.example', 'first\nusername: alice\n')
+        self.storage.insert('host.example (2)', 'second\nusername: root\nusername: bob\n')
+        self.assertEqual(self.storage.resolve('host.example', 'alice'), 'host.example')
+        self.assertEqual(self.storage.resolve('host.example', 'bob'), 'host.example (2)')
+        self.assertIsNone(self.storage.resolve('host.example', 'carol'))
+        self.assertEqual(self.storage.index.logins['host.example'], {
+            'alice': 'host.example', 'bob': 'host.example (2)'})
+
+        decrypted = []
+        entry = self.storage.entry
+        self.storage.entry = lambda name: decrypted.append(name) or entry(name)
+        self.assertEqual(self.storage.resolve('host.example', 'bob'), 'host.example (2)')
+        self.assertEqual(decrypted, ['host.example (2)'])
+
+        self.storage.edit('host.example (2)', 'second\nusername: root\n')
+        self.assertIsNone(self.storage.resolve('host.example', 'bob'))
+
+    def test_fuzzy(self):
+        self.assertEqual(self.storage.fuzzy('exa'), ['example.com', 'sub/otp:example'])
+        names = self.storage._names
+        self.assertEqual(self.storage.fuzzy('otp'), ['sub/otp:example'])
+        self.assertIs(self.storage._names, names)
+
+        self.storage.insert('sub/otp', 'secret\n')
+        self.assertEqual(self.storage.fuzzy('otp', limit=1), ['sub/otp'])
+
+    def test_tree(self):
+        os.makedirs(os.path.join(self.path, 'sub', 'deep'))
+        self.storage.insert('sub/deep/example.net', 'secret\n')
+        self.assertEqual(self.storage.list(), (['sub'], ['example.com']))
+        self.assertEqual(self.storage.list('sub'), (['deep'], ['otp:example']))
+        self.assertEqual(self.storage.show(), '\n'.join((
+            'Password Store',
+            '├── example.com',
+            '└── sub',
+            '    ├── deep',
+            '    │   └── example.net',
+            '    └── otp:example',
+        )))
+        self.assertEqual(self.storage.show('sub/deep'), 'sub/deep\n└── example.net')
+
+        self.storage.move('sub/deep/example.net', 'example.net')
+        os.rmdir(os.path.join(self.path, 'sub', 'deep'))
+        self.assertEqual(self.storage.list(), (['sub'], ['example.com', 'example.net']))
+        self.assertEqual(self.storage.list('sub'), ([], ['otp:example']))
+        with self.assertRaises(exception.NotFoundStorageError):
+            self.storage.list('sub/deep')
+
+        # the tree is restored from the saved index
+        self.assertEqual(self.open().list('sub'), ([], ['otp:example']))
+
+    def test_cache(self):
+        self.storage.cache.clear()
+        self.assertEqual(self.storage.show('example.com').split('\n')[0], 'secret')
+        self.assertEqual(self.storage.show('example.com').split('\n')[0], 'secret')
+        self.assertEqual((self.storage.cache.hits, self.storage.cache.misses), (1, 1))
+        self.assertIs(self.storage.entry('example.com'), self.storage.entry('example.com'))
+
+        self.storage.edit('example.com', 'changed\n')
+        self.assertEqual(self.storage.show('example.com'), 'changed\n')
+        self.assertEqual(self.storage.cache.misses, 2)
+
+        with open(os.path.join(self.path, 'example.com'), 'w') as f:
+            f.write(encrypt('external\n', self.password))
+        self.assertEqual(self.storage.show('example.com'), 'external\n')
+
+        self.storage.close()
+        self.assertEqual(len(self.storage.cache), 0)
+
+    def test_generation(self):
+        generation = self.storage.generation
+        self.assertEqual(self.storage.generation, generation)
+
+        self.storage.insert('example.org', 'secret\n')
+        self.assertGreater(self.storage.generation, generation)
+        generation = self.storage.generation
+
+        with open(os.path.join(self.path, 'sub', 'external'), 'w') as f:
+            f.write(encrypt('secret\n', self.password))
+        self.assertGreater(self.storage.generation, generation)
+        generation = self.storage.generation
+
+        # changes made while the storage is locked
+        self.storage.close()
+        os.remove(os.path.join(self.path, 'sub', 'external'))
+        self.storage.open(self.password)
+        self.assertGreater(self.storage.generation, generation)
+
+    def test_insert_many(self):
+        names = self.storage.insert_many([
+            ('example.com', 'first\n'),
+            ('example.com', 'second\n'),
+            ('sub/example.net', 'third\nusername: user\n'),
+        ], workers=2)
+        self.assertEqual(names, ['example.com (2)', 'example.com (3)', 'sub/example.net'])
+        self.assertEqual(self.storage.show('example.com (3)'), 'second\n')
+        self.assertEqual(self.storage.index.meta('sub/example.net')['username'], 'user')
+
+    def test_insert_many_race(self):
+        # an item of the same name is created while the batch is encrypted
+        encrypt_item = self.storage._encrypt
+        def _encrypt(text):
+            if not os.path.exists(os.path.join(self.path, 'race.com')):
+                with open(os.path.join(self.path, 'race.com'), 'w') as f:
+                    f.write(encrypt('theirs\n', self.password))
+            return encrypt_item(text)
+        self.storage._encrypt = _encrypt
+
+        self.assertEqual(self.storage.insert_many([('race.com', 'mine\n')]), ['race.com (2)'])
+        self.assertEqual(self.storage.show('race.com'), 'theirs\n')
+        self.assertEqual(self.storage.show('race.com (2)'), 'mine\n')
+        self.assertEqual(list(self.storage.find('race')), ['race.com', 'race.com (2)'])
@@ -0,0 +1,116 @@
+import os
+import queue
+import tempfile
+import time
+import unittest
+
+from kitsupass import watcher
+from kitsupass.openssl import encrypt
+
+from .test_storage import StorageTestCase
+
+
+class WatcherMixin:
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+        os.makedirs(os.path.join(self.path, 'sub'))
+        os.makedirs(os.path.join(self.path, '.git'))
+        with open(os.path.join(self.path, 'sub', 'item'), 'w') as f:
+            f.write('item')
+
+        self.events = queue.Queue()
+        self.watcher = self.create()
+        self.watcher.subscribe(lambda *event: self.events.put(event))
+        self.watcher.start()
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.tmp.cleanup()
+
+    def create(self) -> watcher.Watcher:
+        raise NotImplementedError
+
+    def assertEvents(self, *expected):
+        events = set()
+        deadline = time.monotonic() + 5
+        while not events >= set(expected) and time.monotonic() < deadline:
+            try:
+                events.add(self.events.get(timeout=0.05))
+            except queue.Empty:
+                pass
+        self.assertGreaterEqual(events, set(expected))
+
+    def write(self, path: str, text: str):
+        with open(os.path.join(self.path, path), 'w') as f:
+            f.write(text)
+
+    def test_events(self):
+        self.write('sub/new', 'new')
+        self.assertEvents(('created', 'sub/new', False))
+
+        self.write('sub/item', 'changed')
+        self.assertEvents(('modified', 'sub/item', False))
+
+        os.rename(os.path.join(self.path, 'sub', 'new'), os.path.join(self.path, 'renamed'))
+        self.assertEvents(('deleted', 'sub/new', False), ('created', 'renamed', False))
+
+        os.makedirs(os.path.join(self.path, 'folder'))
+        self.assertEvents(('created', 'folder', True))
+        self.write('folder/item', 'item')
+        self.assertEvents(('created', 'folder/item', False))
+
+        os.remove(os.path.join(self.path, 'sub', 'item'))
+        os.rmdir(os.path.join(self.path, 'sub'))
+        self.assertEvents(('deleted', 'sub/item', False), ('deleted', 'sub', True))
+
+        self.write('.git/index', 'hidden')
+        self.write('hidden', 'item')
+        self.assertEvents(('created', 'hidden', False))
+        self.assertFalse(any(path.startswith('.git') for kind, path, is_dir in self.events.queue))
+
+
+class TestInotifyWatcher(WatcherMixin, unittest.TestCase):
+    def create(self) -> watcher.Watcher:
+        try:
+            return watcher.InotifyWatcher(self.path)
+        except (OSError, AttributeError):
+            self.skipTest('inotify is not available')
+
+
+class TestPollingWatcher(WatcherMixin, unittest.TestCase):
+    def create(self) -> watcher.Watcher:
+        return watcher.PollingWatcher(self.path, interval=0.01)
+
+
+class TestStorageWatcher(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage.watch()
+
+    def tearDown(self):
+        self.storage.unwatch()
+        super().tearDown()
+
+    def wait(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_invalidate(self):
+        self.assertEqual(self.storage.show('example.com').split('\n')[0], 'secret')
+        self.assertEqual(self.storage.index.refresh(), False)
+        self.assertEqual(self.storage.index.changed, set())
+
+        with open(os.path.join(self.path, 'example.com'), 'w') as f:
+            f.write(encrypt('external\n', self.password))
+        os.makedirs(os.path.join(self.path, 'new'))
+        with open(os.path.join(self.path, 'new', 'external'), 'w') as f:
+            f.write(encrypt('secret\nusername: external', self.password))
+
+        self.wait(lambda: not self.storage.cache.items
+                  and {'', 'new'} <= self.storage.index.changed)
+        self.assertEqual(self.storage.show('example.com'), 'external\n')
+        self.assertEqual(list(self.storage.find('external')), ['new/external'])
+        self.assertEqual(self.storage.meta('new/external')['username'], 'external')
+        self.assertEqual(self.storage.index.changed, set())